@@ -1,3 +1,4 @@
+import argparse
 import csv
 import os
 import time
@@ -7,6 +8,17 @@ import langcodes
 import torch
 import whisper
 
+import audio_cache
+import thread_planner
+from asr_cache import asr_cache
+from encoder_cache import encoder_cache
+import vad as voice_activity
+import whisper_decode
+from model_registry import registry
+from quantize import QUANTIZE_CHOICES, quantize_model
+from repetition_guard import repetition_guard
+from tracing import instrument_whisper, tracer
+
 # Suppress specific warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="torch.cuda")
 warnings.filterwarnings("ignore", category=UserWarning, module="whisper.transcribe")
@@ -44,34 +56,125 @@ class Record:
         print(f"Note: {self.note}")
 
 
-def transcribe_audio(file_path, model, device="cpu", expect="", note=""):
+def load_model(model_size="tiny", device="cpu", quantize=None):
     """
-    Transcriptions the given audio file using the specified Whisper model.
+    Loads a Whisper model onto the given device.
+
+    Models are kept in the shared model registry, so loading the same checkpoint
+    again returns the resident instance until it is evicted by the RAM budget.
 
     Args:
-        file_path (str): Path to the audio file to be transcribed.
-        model (WhisperModel): The loaded Whisper model to use for transcription.
-        device (str): The device to run the model on. Default is "cpu". Can be "cpu" or "cuda".
+        model_size (str): Whisper checkpoint name, e.g. "tiny" or "large-v3".
+        device (str): The device to run the model on. Can be "cpu" or "cuda".
+        quantize (str | None): "int8" applies dynamic quantization to the Linear
+            layers (CPU only). None keeps the fp32 weights.
 
     Returns:
-        tuple: A tuple containing the transcribed text, the detected language, and the execution time.
+        tuple: The loaded model and the load time in seconds.
+    """
+    start_time = time.time()
+    model = registry.get(
+        ("whisper", model_size, device, quantize),
+        lambda: encoder_cache.install(
+            instrument_whisper(
+                quantize_model(whisper.load_model(model_size, device=device), quantize)
+            ),
+            f"whisper-{model_size}-{device}-{quantize or 'fp32'}",
+        ),
+    )
+    if device == "cpu":
+        thread_planner.configure(f"whisper-{model_size}", model)
+    return model, time.time() - start_time
 
-    Raises:
-        FileNotFoundError: If the specified audio file does not exist.
+
+def run_transcription(file_path, model, vad, decode_options) -> dict:
     """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Audio file {file_path} does not exist.")
+    Runs model.transcribe and returns the text, language, segments and execution time.
 
-    torch.set_num_threads(4)
+    With vad=True the segment start/end are mapped back to the original audio.
+    """
+    audio = audio_cache.load_audio(file_path)
+    speech = None
+    if vad:
+        speech = voice_activity.detect_speech(audio)
+        audio = speech.compact(audio)
 
     start_time = time.time()
-    result = model.transcribe(file_path)
+    if len(audio):
+        label = file_path if isinstance(file_path, str) else ""
+        with (
+            encoder_cache.cached_mel(),
+            repetition_guard.active(label),
+            tracer.span("whisper.transcribe", "whisper", file=label),
+        ):
+            result = model.transcribe(audio, **decode_options)
+    else:
+        result = {"text": "", "language": ""}
     end_time = time.time()
 
     execution_time = end_time - start_time
+    segments = result.get("segments", [])
+    if speech:
+        print(speech.report(execution_time))
+        # Segment times are measured on the compacted audio; map them back
+        segments = speech.restore_timestamps(segments)
+    return {
+        "text": result["text"],
+        "language": result["language"],
+        "segments": segments,
+        "time": execution_time,
+    }
+
 
+def transcribe_audio(
+    file_path, model, device="cpu", expect="", note="", vad=False, **decode_options
+):
+    """
+    Transcriptions the given audio file using the specified Whisper model.
+
+    Args:
+        file_path (str | np.ndarray): Path to the audio file to be transcribed, or
+            16 kHz mono float32 audio as returned by audio_cache.load_audio.
+        model (WhisperModel): The loaded Whisper model to use for transcription.
+        device (str): The device to run the model on. Default is "cpu". Can be "cpu" or "cuda".
+        vad (bool): Strip silence with the energy VAD and transcribe only the speech regions.
+        **decode_options: Passed to model.transcribe (language, task, temperature, ...).
+            The log-mel and encoder output are cached, so re-running the same audio
+            with different options only re-runs the decoder.
+
+    Results for audio files are stored in the ASR result cache keyed by the audio
+    content, model checkpoint and options; a hit returns the stored text, language
+    and timing without running the model (see asr_cache.refresh).
+
+    Decoding runs under the repetition guard, which stops segments stuck in a
+    repetition loop early (see repetition_guard.config).
+
+    Returns:
+        tuple: A tuple containing the transcribed text, the detected language, the
+            execution time and the Whisper segments. With vad=True the segment
+            start/end are times in the original audio, not in the compacted speech.
+
+    Raises:
+        FileNotFoundError: If the specified audio file does not exist.
+    """
+    result = asr_cache.get_or_run(
+        file_path,
+        "whisper",
+        getattr(model, "checkpoint", None),
+        lambda: run_transcription(file_path, model, vad, decode_options),
+        task=decode_options.get("task", "transcribe"),
+        language=decode_options.get("language"),
+        options={
+            "vad": vad,
+            "repetition_guard": repetition_guard.cache_options(),
+            **decode_options,
+        },
+    )
     detected_language = result["language"]
     transcribed_text = result["text"]
+    execution_time = result["time"]
+    # Results cached before segments were stored have none
+    segments = result.get("segments", [])
 
     # 如果檢測到的語言是中文，確保使用繁體中文
     if detected_language in ["zh", "yue"]:
@@ -101,10 +204,114 @@ def transcribe_audio(file_path, model, device="cpu", expect="", note=""):
     elif detected_language in ["en"]:
         detected_language = "en"
 
-    return transcribed_text, detected_language, execution_time
+    return transcribed_text, detected_language, execution_time, segments
 
 
-def evaluate(model="tiny"):
+def normalize_language(language: str) -> str:
+    return "zh" if language in ["zh", "yue"] else language
+
+
+def transcribe_batch(
+    file_paths,
+    model,
+    model_name="",
+    load_time=0,
+    batch_size=16,
+    language=None,
+    vad=False,
+):
+    """
+    Transcribes several short clips as one batch and returns a Record per clip.
+
+    The clips' 30-second windows are stacked and run through the encoder and
+    decoder together (see whisper_decode.transcribe_batch); the language is
+    detected per clip. Clips already in the ASR result cache are not re-run.
+
+    Args:
+        file_paths (list[str]): Paths of the audio files to transcribe.
+        model (WhisperModel): The loaded Whisper model to use for transcription.
+        model_name (str): Stored in Record.model.
+        load_time (float): Stored in Record.load_time.
+        batch_size (int): Clips per batch.
+        language (str | None): Force the language of every clip.
+        vad (bool): Strip silence from each clip with the energy VAD before
+            batching; clips without speech get an empty transcription.
+
+    Returns:
+        list[Record]: One record per clip that could be loaded, in input order.
+            Clips that fail to load are reported and skipped, like the
+            sequential loop in evaluate. transcribe_time is the batch time
+            divided by the number of clips in the batch.
+    """
+    options = {
+        "batched": True,
+        "vad": vad,
+        "repetition_guard": repetition_guard.cache_options(),
+    }
+    checkpoint = getattr(model, "checkpoint", None)
+    keys = [None] * len(file_paths)
+    results = [None] * len(file_paths)
+
+    audios, speeches = {}, {}
+    for i, path in enumerate(file_paths):
+        # The cache key hashes the file, so a missing file fails here already
+        try:
+            keys[i] = asr_cache.key(
+                path, "whisper", checkpoint, "transcribe", language, options
+            )
+            results[i] = asr_cache.lookup(keys[i])
+            if results[i] is not None:
+                continue
+            audio = audio_cache.load_audio(path)
+        except Exception as e:
+            print(f"Error processing {path}: {str(e)}\n")
+            continue
+        if vad:
+            speeches[i] = voice_activity.detect_speech(audio)
+            audio = speeches[i].compact(audio)
+        if len(audio):
+            audios[i] = audio
+        else:
+            if i in speeches:
+                print(speeches[i].report(0))
+            results[i] = {"text": "", "language": "", "time": 0}
+            asr_cache.store(keys[i], results[i])
+
+    if audios:
+        start_time = time.time()
+        with repetition_guard.active("batch"):
+            decoded = whisper_decode.transcribe_batch(
+                model,
+                list(audios.values()),
+                language=language,
+                batch_size=batch_size,
+            )
+        execution_time = (time.time() - start_time) / len(audios)
+        for i, result in zip(audios, decoded):
+            if i in speeches:
+                print(speeches[i].report(execution_time))
+            results[i] = {
+                "text": result["transcribe"],
+                "language": result["language"],
+                "time": execution_time,
+            }
+            asr_cache.store(keys[i], results[i])
+
+    return [
+        Record(
+            model=model_name,
+            filename=path,
+            lang=normalize_language(result["language"]),
+            load_time=load_time,
+            transcribe_time=result["time"],
+            transcribe=result["text"],
+        )
+        for path, result in zip(file_paths, results)
+        if result is not None
+    ]
+
+
+def evaluate(model="tiny", vad=False, quantize=None, batched=False):
     folder = "test-data"
     audio_files = [
         ("sample-zh-01.mp3", "中文語音辨識測試", "中文語音辨識測試"),
@@ -126,23 +333,43 @@ def evaluate(model="tiny"):
     print(f"============= {model} ============")
     # Load the model once before the loop
     device = "cpu"  # or "cuda" if you have a GPU
-    time1 = time.time()
-    loaded_model = whisper.load_model(model).to(device)
-    time2 = time.time()
+    loaded_model, load_time = load_model(model, device, quantize=quantize)
 
     records = []
+    if batched:
+        clips = {
+            os.path.join(folder, file_name): (file_name, expect, note)
+            for file_name, expect, note in audio_files
+        }
+        batch = transcribe_batch(
+            list(clips),
+            loaded_model,
+            model_name=model,
+            load_time=load_time,
+            vad=vad,
+        )
+        for record in batch:
+            record.filename, record.expect, record.note = clips[record.filename]
+            record.display_info()
+            records.append(record)
+        return records
 
     for i, (file_name, expect, note) in enumerate(audio_files, 1):
         record = Record()
         audio_file = os.path.join(folder, file_name)
         record.model = model
         try:
-            transcribe, lang, time_taken = transcribe_audio(
-                audio_file, model=loaded_model, device=device, expect=expect, note=note
+            transcribe, lang, time_taken, _ = transcribe_audio(
+                audio_file,
+                model=loaded_model,
+                device=device,
+                expect=expect,
+                note=note,
+                vad=vad,
             )
             record.filename = file_name
             record.lang = lang
-            record.load_time = time2 - time1
+            record.load_time = load_time
             record.transcribe_time = time_taken
             record.expect = expect
             record.note = note
@@ -192,11 +419,47 @@ def write_records_to_csv(records, filename):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate Whisper model sizes.")
+    parser.add_argument("--quantize", choices=QUANTIZE_CHOICES)
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached transcriptions and re-run every file.",
+    )
+    parser.add_argument(
+        "--no-repetition-guard",
+        action="store_true",
+        help="Let the decoder run repetition loops to the token limit.",
+    )
+    parser.add_argument(
+        "--batched",
+        action="store_true",
+        help="Transcribe all clips of a model as one batch instead of one by one.",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write a Chrome trace of every stage to PATH and print a summary.",
+    )
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enable()
+    asr_cache.refresh = args.refresh
+    repetition_guard.config.enabled = not args.no_repetition_guard
+
     records = []
-    records.extend(evaluate("tiny"))
-    records.extend(evaluate("small"))
-    records.extend(evaluate("medium"))
-    records.extend(evaluate("large-v3"))
+    for model_size in ["tiny", "small", "medium", "large-v3"]:
+        with tracer.context(f"whisper-{model_size}"):
+            records.extend(
+                evaluate(model_size, quantize=args.quantize, batched=args.batched)
+            )
+    registry.print_stats()
+    encoder_cache.print_stats()
+    asr_cache.print_stats()
+    repetition_guard.print_report()
+    if args.trace:
+        tracer.print_summary()
+        tracer.export(args.trace)
 
     write_records_to_csv(records, "dist/cpu-kent.csv")
     # write_records_to_csv(records, "dist/cpu-3080.csv")
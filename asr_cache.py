@@ -0,0 +1,122 @@
+"""
+語音辨識結果的持久化快取。
+
+鍵為 (音檔內容的 sha256, 引擎, 模型 checkpoint, task, 語言, 解碼選項)，值為轉錄文字、
+偵測到的語言與當時量到的耗時。音檔與模型都沒變時直接回傳先前的結果，不再執行推論；
+refresh=True 時一律重跑並覆寫快取。
+
+只有以檔案路徑傳入的音檔會被快取；傳入 ndarray 的呼叫 (benchmark、串流、長音檔切段)
+每次都會執行推論，計時才有意義。
+"""
+
+from collections.abc import Callable
+from pathlib import Path
+
+import audio_cache
+from kv_cache import DEFAULT_CACHE_DIR, SqliteLRUCache, make_key
+
+DEFAULT_ASR_CACHE_PATH = DEFAULT_CACHE_DIR / "asr-results.sqlite3"
+
+
+class AsrResultCache:
+    """
+    使用方法：
+    1. asr_cache.get_or_run(audio_file, engine, model, run, task=..., options=...)
+       快取命中時回傳儲存的結果，否則呼叫 run() 並存下它回傳的 dict；run() 回傳 None 表示失敗，不會存下
+    2. asr_cache.refresh = True 強制重跑 (各 CLI 的 --refresh)
+    3. asr_cache.print_stats() 查看命中率
+    """
+
+    def __init__(self, path: Path = DEFAULT_ASR_CACHE_PATH, refresh: bool = False):
+        self.path = path
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._cache = None
+
+    @property
+    def cache(self) -> SqliteLRUCache:
+        # 第一次使用時才開啟資料庫
+        if self._cache is None:
+            self._cache = SqliteLRUCache(self.path)
+        return self._cache
+
+    def get_or_run(
+        self,
+        audio_file,
+        engine: str,
+        model: str | None,
+        run: Callable[[], dict | None],
+        task: str = "transcribe",
+        language: str | None = None,
+        options: dict | None = None,
+    ) -> dict | None:
+        """
+        取得快取的辨識結果，未命中時執行 run()。
+
+        Args:
+            audio_file (str | Path | np.ndarray): 音檔路徑；ndarray 不快取
+            engine (str): 引擎名稱，例如 "whisper" 或 "m4t-direct"
+            model (str | None): 模型 checkpoint 與版本；None 表示無法辨識模型，不快取
+            run (Callable[[], dict | None]): 執行推論並回傳可 JSON 序列化結果的函式，
+                失敗時回傳 None (不寫入快取)
+            task (str): 任務，例如 "transcribe" 或 "translate"
+            language (str | None): 指定的語言，None 表示自動偵測
+            options (dict | None): 其他會影響結果的解碼選項
+
+        Returns:
+            dict | None: run() 的結果 (或先前儲存的結果)
+        """
+        key = self.key(audio_file, engine, model, task, language, options)
+        if key is None:
+            return run()
+
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+        result = run()
+        self.store(key, result)
+        return result
+
+    def key(
+        self,
+        audio_file,
+        engine: str,
+        model: str | None,
+        task: str = "transcribe",
+        language: str | None = None,
+        options: dict | None = None,
+    ) -> str | None:
+        """快取鍵；音檔不是路徑或無法辨識模型時回傳 None (不快取)"""
+        if not isinstance(audio_file, (str, Path)) or model is None:
+            return None
+        return make_key(
+            audio_cache.file_sha256(audio_file),
+            engine,
+            model,
+            task,
+            language,
+            options or {},
+        )
+
+    def lookup(self, key: str | None) -> dict | None:
+        """取得儲存的結果；refresh 時一律視為未命中"""
+        if key is not None and not self.refresh:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+        self.misses += 1
+        return None
+
+    def store(self, key: str | None, result: dict | None) -> None:
+        if key is not None and result is not None:
+            self.cache.put(key, result)
+
+    def print_stats(self) -> None:
+        mode = " (refresh)" if self.refresh else ""
+        print(f"ASR result cache{mode}: {self.hits} hits, {self.misses} runs")
+
+
+# 整個行程共用的快取
+asr_cache = AsrResultCache()
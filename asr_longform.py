@@ -0,0 +1,261 @@
+"""
+長音檔的平行轉錄。
+
+以 VAD 在靜音處把音檔切成多個 chunk，交給多個 worker 行程各自執行 model.transcribe，
+最後把各 chunk 的 segment 換算回全域時間並串接。超過 chunk 長度的連續語音會以
+重疊的方式硬切，重疊區內的 segment 以其中點落在哪一側來決定保留哪一個 chunk 的結果。
+
+預設以 fork 建立 worker：模型在主行程載入一次，worker 透過 copy-on-write 共用權重；
+--spawn 或 --device cuda 時每個 worker 自行載入模型。
+
+uv run asr_longform.py meeting.mp3 --model large-v3 --workers 8
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+import asr1
+import audio_cache
+import thread_planner
+import vad as voice_activity
+
+SAMPLE_RATE = audio_cache.SAMPLE_RATE
+
+# worker 行程內的狀態，由 init_worker 設定
+_model = None
+_audio_path = None
+
+
+@dataclass
+class Chunk:
+    index: int
+    start: float
+    end: float
+    # 只保留中點落在 [keep_from, keep_until) 的 segment
+    keep_from: float
+    keep_until: float
+
+
+def plan_chunks(
+    audio: np.ndarray, chunk_seconds: float, overlap_seconds: float = 2.0
+) -> list[Chunk]:
+    """
+    在靜音處切分音檔。
+
+    相鄰的語音區段合併到不超過 chunk_seconds 為止；區段之間的靜音不會送進模型。
+    單一區段超過 chunk_seconds 時以 overlap_seconds 的重疊硬切。
+    """
+    spans = []
+    for region in voice_activity.detect_speech(audio).regions:
+        if spans and region.end - spans[-1][0] <= chunk_seconds:
+            spans[-1][1] = region.end
+        else:
+            spans.append([region.start, region.end])
+
+    chunks = []
+    for start, end in spans:
+        piece_start = keep_from = start
+        while piece_start + chunk_seconds < end:
+            piece_end = piece_start + chunk_seconds
+            cut = piece_end - overlap_seconds / 2
+            chunks.append(Chunk(len(chunks), piece_start, piece_end, keep_from, cut))
+            keep_from = cut
+            piece_start = piece_end - overlap_seconds
+        chunks.append(Chunk(len(chunks), piece_start, end, keep_from, end))
+    return chunks
+
+
+def init_worker(
+    audio_path: str,
+    model_size: str,
+    device: str,
+    plans: list[thread_planner.ThreadPlan],
+    next_index,
+    load_model: bool,
+):
+    global _model, _audio_path
+    _audio_path = audio_path
+    if load_model:
+        _model, _ = asr1.load_model(model_size, device)
+    # 每個 worker 依啟動順序取得一組不重疊的核心
+    with next_index.get_lock():
+        index = next_index.value
+        next_index.value += 1
+    thread_planner.apply_plan(plans[index % len(plans)])
+
+
+def transcribe_chunk(chunk: Chunk, language: str | None) -> tuple[Chunk, list, float]:
+    """在 worker 中轉錄一個 chunk，回傳換算成全域時間的 segments 與耗時"""
+    audio = audio_cache.load_audio(_audio_path)
+    samples = np.array(
+        audio[int(chunk.start * SAMPLE_RATE) : int(chunk.end * SAMPLE_RATE)]
+    )
+    start = time.perf_counter()
+    result = _model.transcribe(samples, language=language)
+    elapsed = time.perf_counter() - start
+    segments = [
+        {
+            "start": segment["start"] + chunk.start,
+            "end": segment["end"] + chunk.start,
+            "text": segment["text"],
+        }
+        for segment in result["segments"]
+    ]
+    return chunk, segments, elapsed
+
+
+def stitch(results: list[tuple[Chunk, list, float]]) -> list[dict]:
+    """依 chunk 的保留範圍去除重疊區的重複 segment 並依時間排序"""
+    segments = []
+    for chunk, chunk_segments, _ in results:
+        # 沒有和下一個 chunk 重疊時，超出 chunk 結尾一點的 segment 也保留
+        overlapped = chunk.keep_until < chunk.end
+        for segment in chunk_segments:
+            middle = (segment["start"] + segment["end"]) / 2
+            before_cut = middle < chunk.keep_until or not overlapped
+            if middle >= chunk.keep_from and before_cut:
+                segments.append(segment)
+    segments.sort(key=lambda segment: segment["start"])
+    return [{"id": i, **segment} for i, segment in enumerate(segments)]
+
+
+def detect_language(model, audio: np.ndarray) -> str:
+    import whisper_decode
+
+    features = whisper_decode.encode_windows(model, np.array(audio[: 30 * SAMPLE_RATE]))
+    return whisper_decode.detect_language(model, features)
+
+
+def transcribe_long(
+    audio_file: str,
+    model_size: str = "large-v3",
+    workers: int | None = None,
+    chunk_seconds: float | None = None,
+    language: str | None = None,
+    spawn: bool = False,
+    device: str = "cpu",
+) -> dict:
+    """
+    以多個 worker 行程轉錄長音檔。
+
+    Args:
+        audio_file (str): 音檔路徑
+        model_size (str): Whisper 模型大小
+        workers (int | None): worker 數量，預設為實體核心數 / 4；
+            每個 worker 的執行緒數與綁定的核心由 thread_planner 決定
+        chunk_seconds (float | None): chunk 長度上限，預設依音檔長度與 worker 數自動決定
+        language (str | None): 指定語言；None 時以第一個 chunk 偵測一次
+        spawn (bool): 每個 worker 自行載入模型，而不是 fork 共用主行程的權重
+        device (str): "cpu" 或 "cuda"；cuda 一律以 spawn 建立 worker
+
+    Returns:
+        dict: text、segments、language 與效能統計
+    """
+    topology = thread_planner.detect_topology()
+    workers = workers or max(len(topology.cores) // 4, 1)
+    audio = audio_cache.load_audio(audio_file)
+    duration = len(audio) / SAMPLE_RATE
+    # 每個 worker 約分到兩個 chunk，讓長短不一的 chunk 也能平均分配
+    chunk_seconds = chunk_seconds or min(max(duration / (workers * 2), 30.0), 600.0)
+    chunks = plan_chunks(audio, chunk_seconds)
+
+    global _model
+    # CUDA 在 fork 出來的子行程中無法重新初始化，worker 必須以 spawn 建立並自行載入模型
+    spawn = spawn or device == "cuda"
+    start = time.perf_counter()
+    if not spawn:
+        # fork 前在主行程載入，worker 以 copy-on-write 共用權重
+        _model, _ = asr1.load_model(model_size, device)
+    plans = thread_planner.plan_threads(
+        f"whisper-{model_size}",
+        thread_planner.count_parameters(_model),
+        workers,
+        topology,
+    )
+    context = multiprocessing.get_context("spawn" if spawn else "fork")
+    next_index = context.Value("i", 0)
+    with context.Pool(
+        workers,
+        initializer=init_worker,
+        initargs=(audio_file, model_size, device, plans, next_index, spawn),
+    ) as pool:
+        if language is None and chunks:
+            model = _model
+            if model is None:
+                model, _ = asr1.load_model(model_size, device)
+            first = chunks[0]
+            language = detect_language(
+                model,
+                audio[int(first.start * SAMPLE_RATE) : int(first.end * SAMPLE_RATE)],
+            )
+        results = pool.starmap(
+            transcribe_chunk, [(chunk, language) for chunk in chunks]
+        )
+    wall_time = time.perf_counter() - start
+
+    segments = stitch(results)
+    compute_time = sum(elapsed for _, _, elapsed in results)
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": language,
+        "chunks": [asdict(chunk) for chunk, _, _ in results],
+        "stats": {
+            "audio_seconds": duration,
+            "workers": workers,
+            "threads_per_worker": plans[0].intra_op,
+            "chunks": len(chunks),
+            "wall_time": wall_time,
+            "compute_time": compute_time,
+            "parallel_speedup": compute_time / wall_time if wall_time else 0.0,
+            "throughput": duration / wall_time if wall_time else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel long-form transcription.")
+    parser.add_argument("audio_file")
+    parser.add_argument("--model", default="large-v3")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--chunk-seconds", type=float)
+    parser.add_argument("--language")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument(
+        "--spawn",
+        action="store_true",
+        help="Load one model per worker process (always on with --device cuda).",
+    )
+    parser.add_argument("--output", help="Write the result as JSON.")
+    args = parser.parse_args()
+
+    result = transcribe_long(
+        args.audio_file,
+        model_size=args.model,
+        workers=args.workers,
+        chunk_seconds=args.chunk_seconds,
+        language=args.language,
+        spawn=args.spawn,
+        device=args.device,
+    )
+    print(result["text"])
+    stats = result["stats"]
+    print(
+        f"{stats['audio_seconds']:.0f}s audio in {stats['wall_time']:.1f}s "
+        f"({stats['throughput']:.1f}x real time) with {stats['workers']} workers, "
+        f"{stats['chunks']} chunks, speedup {stats['parallel_speedup']:.1f}x",
+        file=sys.stderr,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
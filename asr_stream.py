@@ -0,0 +1,218 @@
+import argparse
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import asr1
+import audio_cache
+
+SAMPLE_RATE = audio_cache.SAMPLE_RATE
+BYTES_PER_SAMPLE = 2  # 16-bit PCM
+
+
+@dataclass
+class StreamUpdate:
+    """每處理一個 chunk 產生的結果"""
+
+    committed: str
+    partial: str
+    stream_time: float
+    compute_time: float
+    latency: float
+
+
+@dataclass
+class StreamingTranscriber:
+    """
+    以滑動視窗對連續音訊做即時轉錄。
+
+    每收到一個 chunk 就對目前的緩衝區重新轉錄，並與上一次的假設比較：
+    連續兩次結果相同、且不是最後一段的 segment 視為穩定，提交後從緩衝區移除。
+    緩衝區超過 max_buffer_seconds 時強制提交；提交後仍超過時 (沒有 segment，或 segment
+    的結束時間不合理) 直接丟掉最舊的音訊，確保記憶體與每次推論的長度有上限。
+    """
+
+    model: object
+    language: str | None = None
+    max_buffer_seconds: float = 20.0
+    prompt_chars: int = 200
+    buffer: np.ndarray = field(default_factory=lambda: np.zeros(0, np.float32))
+    buffer_start: float = 0.0
+    committed: list[str] = field(default_factory=list)
+    previous: list[str] = field(default_factory=list)
+
+    def push(self, samples: np.ndarray, arrived_at: float | None = None) -> StreamUpdate:
+        """
+        加入新的音訊並更新假設。
+
+        Args:
+            samples (np.ndarray): 16 kHz 單聲道 float32 音訊
+            arrived_at (float): chunk 最後一個樣本到達的 time.perf_counter()，用來計算延遲
+
+        Returns:
+            StreamUpdate: 新提交的文字、目前的暫定文字與延遲
+        """
+        arrived_at = arrived_at or time.perf_counter()
+        self.buffer = np.concatenate([self.buffer, samples])
+
+        start = time.perf_counter()
+        segments = self.transcribe_buffer()
+        compute_time = time.perf_counter() - start
+
+        texts = [segment["text"] for segment in segments]
+        stable = 0
+        while (
+            stable < len(texts) - 1
+            and stable < len(self.previous)
+            and texts[stable] == self.previous[stable]
+        ):
+            stable += 1
+
+        buffer_seconds = len(self.buffer) / SAMPLE_RATE
+        if buffer_seconds > self.max_buffer_seconds:
+            # 緩衝區已滿：除了最後一段外全部提交，只有一段時整段提交
+            stable = max(len(segments) - 1, 1) if segments else 0
+
+        newly_committed = self.commit(segments[:stable])
+        # 不依賴 segment 的結束時間，緩衝區一律只保留最後 max_buffer_seconds
+        keep = int(self.max_buffer_seconds * SAMPLE_RATE)
+        if len(self.buffer) > keep:
+            self.buffer_start += (len(self.buffer) - keep) / SAMPLE_RATE
+            self.buffer = self.buffer[-keep:]
+        self.previous = texts[stable:]
+
+        return StreamUpdate(
+            committed=newly_committed,
+            partial="".join(self.previous),
+            stream_time=self.buffer_start + len(self.buffer) / SAMPLE_RATE,
+            compute_time=compute_time,
+            latency=time.perf_counter() - arrived_at,
+        )
+
+    def finish(self) -> str:
+        """串流結束時提交剩下的所有文字"""
+        committed = self.commit(self.transcribe_buffer()) if len(self.buffer) else ""
+        self.previous = []
+        return committed
+
+    def transcribe_buffer(self) -> list[dict]:
+        prompt = "".join(self.committed)[-self.prompt_chars :] or None
+        result = self.model.transcribe(
+            self.buffer,
+            language=self.language,
+            initial_prompt=prompt,
+            condition_on_previous_text=False,
+        )
+        # 第一次偵測到的語言固定下來，之後的視窗不必再偵測
+        self.language = self.language or result["language"]
+        return result["segments"]
+
+    def commit(self, segments: list[dict]) -> str:
+        if not segments:
+            return ""
+        end = min(segments[-1]["end"], len(self.buffer) / SAMPLE_RATE)
+        self.buffer = self.buffer[int(end * SAMPLE_RATE) :]
+        self.buffer_start += end
+        text = "".join(segment["text"] for segment in segments)
+        self.committed.append(text)
+        return text
+
+
+def read_pcm_chunks(stream, chunk_seconds: float):
+    """從 stdin 或 named pipe 讀取 16 kHz s16le PCM，逐 chunk 產生 float32 音訊與到達時間"""
+    chunk_bytes = int(chunk_seconds * SAMPLE_RATE) * BYTES_PER_SAMPLE
+    pending = b""
+    while data := stream.read(chunk_bytes - len(pending)):
+        pending += data
+        if len(pending) >= chunk_bytes:
+            yield pcm_to_float(pending), time.perf_counter()
+            pending = b""
+    if len(pending) >= BYTES_PER_SAMPLE:
+        yield pcm_to_float(pending), time.perf_counter()
+
+
+def replay_chunks(audio_file: str, chunk_seconds: float, realtime: bool = True):
+    """將音檔切成 chunk 重播，用於離線測試；realtime=True 時依實際時間送出"""
+    audio = audio_cache.load_audio(audio_file)
+    chunk_size = int(chunk_seconds * SAMPLE_RATE)
+    start = time.perf_counter()
+    for offset in range(0, len(audio), chunk_size):
+        chunk = np.array(audio[offset : offset + chunk_size])
+        if realtime:
+            due = start + (offset + len(chunk)) / SAMPLE_RATE
+            time.sleep(max(due - time.perf_counter(), 0))
+        yield chunk, time.perf_counter()
+
+
+def pcm_to_float(data: bytes) -> np.ndarray:
+    usable = len(data) - len(data) % BYTES_PER_SAMPLE
+    return np.frombuffer(data[:usable], np.int16).astype(np.float32) / 32768.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Streaming Whisper transcription of 16 kHz s16le PCM."
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--input", default="-", help="Named pipe or file with raw PCM, '-' for stdin."
+    )
+    source.add_argument("--replay", help="Audio file to replay as a stream.")
+    parser.add_argument("--model", default="small", help="Whisper model size.")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--language", help="Skip language detection.")
+    parser.add_argument("--chunk-seconds", type=float, default=1.0)
+    parser.add_argument("--max-buffer-seconds", type=float, default=20.0)
+    parser.add_argument(
+        "--fast", action="store_true", help="Replay as fast as possible."
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Print per-chunk latency."
+    )
+    args = parser.parse_args()
+
+    model, load_time = asr1.load_model(args.model, args.device)
+    print(f"Loaded {args.model} in {load_time:.1f}s", file=sys.stderr)
+    transcriber = StreamingTranscriber(
+        model, language=args.language, max_buffer_seconds=args.max_buffer_seconds
+    )
+
+    if args.replay:
+        chunks = replay_chunks(args.replay, args.chunk_seconds, realtime=not args.fast)
+        input_file = None
+    else:
+        input_file = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+        chunks = read_pcm_chunks(input_file, args.chunk_seconds)
+
+    latencies = []
+    try:
+        for samples, arrived_at in chunks:
+            update = transcriber.push(samples, arrived_at)
+            latencies.append(update.latency)
+            if update.committed:
+                print(update.committed, end="", flush=True)
+            if args.verbose:
+                print(
+                    f"\n[{update.stream_time:7.2f}s] latency={update.latency:.2f}s "
+                    f"compute={update.compute_time:.2f}s partial={update.partial!r}",
+                    file=sys.stderr,
+                )
+        print(transcriber.finish(), flush=True)
+    finally:
+        if input_file not in (None, sys.stdin.buffer):
+            input_file.close()
+
+    if latencies:
+        print(
+            f"chunks={len(latencies)} "
+            f"mean_latency={statistics.mean(latencies):.2f}s "
+            f"max_latency={max(latencies):.2f}s",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+from kv_cache import DEFAULT_CACHE_DIR
+from tracing import tracer
+
+AUDIO_CACHE_DIR = DEFAULT_CACHE_DIR / "audio"
+SAMPLE_RATE = 16000
+
+
+def file_sha256(path: str | Path) -> str:
+    """計算檔案內容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(path: str | Path, cache_dir: Path = AUDIO_CACHE_DIR) -> Path:
+    return cache_dir / f"{file_sha256(path)}-{SAMPLE_RATE}.npy"
+
+
+def load_audio(
+    audio: str | Path | np.ndarray, cache_dir: Path = AUDIO_CACHE_DIR
+) -> np.ndarray:
+    """
+    讀取音檔為 16 kHz 單聲道 float32，解碼結果以內容雜湊為鍵快取成 .npy。
+
+    第一次讀取時透過 ffmpeg 解碼並寫入快取，之後以 np.load(mmap_mode="r") 直接映射，
+    不再啟動 ffmpeg 或重新取樣。回傳的陣列是唯讀的。
+
+    Args:
+        audio (str | Path | np.ndarray): 音檔路徑，已解碼的陣列會直接回傳
+        cache_dir (Path): 快取目錄
+
+    Returns:
+        np.ndarray: 16 kHz 單聲道 float32 音訊
+
+    Raises:
+        FileNotFoundError: 音檔不存在
+    """
+    if isinstance(audio, np.ndarray):
+        return audio
+    if not os.path.exists(audio):
+        raise FileNotFoundError(f"Audio file {audio} does not exist.")
+
+    with tracer.span("audio.hash", "audio"):
+        cached = cache_path(audio, cache_dir)
+    if not cached.exists():
+        from whisper.audio import load_audio as ffmpeg_load_audio
+
+        with tracer.span("audio.ffmpeg", "audio", file=str(audio)):
+            decoded = ffmpeg_load_audio(str(audio), sr=SAMPLE_RATE)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # 先寫暫存檔再改名，並行的行程不會讀到寫到一半的檔案
+        tmp_path = cached.with_suffix(f".{os.getpid()}.tmp.npy")
+        np.save(tmp_path, decoded.astype(np.float32, copy=False))
+        os.replace(tmp_path, cached)
+
+    with tracer.span("audio.mmap", "audio"):
+        return np.load(cached, mmap_mode="r")
@@ -0,0 +1,320 @@
+"""
+語音辨識 / 翻譯引擎的統一效能測試。
+
+對 test-data/ 的音檔執行 warm-up 與多次重複，統計每個引擎的載入時間、
+p50/p95 延遲、real-time factor (運算秒數 / 音訊秒數) 與 peak RSS，輸出 JSON，
+並可與先前的結果 (JSON 或 compare-20240925.csv 格式的 CSV) 比較。
+
+uv run benchmark.py --engine whisper --model-sizes tiny small --repeat 3
+uv run benchmark.py --engine m4t --baseline test-data/compare-20240925.csv
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import resource
+import statistics
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+import audio_cache
+from tracing import tracer
+
+ENGINES = ["whisper", "whisper-translate", "whisper-assisted", "m4t", "m4t-direct"]
+
+
+@dataclass
+class Engine:
+    """要測試的引擎：load() 載入模型並回傳對單一音檔執行推論的函式"""
+
+    name: str
+    model: str
+    load: Callable[[], Callable[[np.ndarray, str], object]]
+
+
+def whisper_engine(model_size: str) -> Engine:
+    def load():
+        import asr1
+
+        model, _ = asr1.load_model(model_size)
+        return lambda audio, path: asr1.transcribe_audio(audio, model)
+
+    return Engine("whisper", model_size, load)
+
+
+def whisper_translate_engine(model_size: str) -> Engine:
+    def load():
+        import asr1
+        import whisper_v3
+
+        model, _ = asr1.load_model(model_size)
+        return lambda audio, path: whisper_v3.transcribe_and_translate(audio, model)
+
+    return Engine("whisper-translate", model_size, load)
+
+
+def whisper_assisted_engine() -> Engine:
+    def load():
+        import whisper_assisted
+
+        processor = whisper_assisted.get_processor()
+        model = whisper_assisted.load_main()
+        assistant = whisper_assisted.load_assistant()
+        return lambda audio, path: whisper_assisted.transcribe(
+            audio, model, processor, assistant
+        )
+
+    return Engine(
+        "whisper-assisted",
+        "openai/whisper-large-v3+distil-whisper/distil-large-v3",
+        load,
+    )
+
+
+def m4t_engine() -> Engine:
+    def load():
+        import m4t_pipeline
+
+        m4t_pipeline.get_model()
+
+        def run(audio, path):
+            target_lang = m4t_pipeline.LANG_CODES[file_lang(path)]
+            result = m4t_pipeline.transcribe(audio, target_lang=target_lang)
+            return m4t_pipeline.translate(result["text"], target_lang)
+
+        return run
+
+    return Engine("m4t", "facebook/seamless-m4t-v2-large", load)
+
+
+def m4t_direct_engine() -> Engine:
+    def load():
+        import m4t_pipeline
+
+        m4t_pipeline.get_model()
+        return lambda audio, path: m4t_pipeline.speech_to_english(audio)
+
+    return Engine("m4t-direct", "facebook/seamless-m4t-v2-large", load)
+
+
+def file_lang(path: str) -> str:
+    """從 serenity-zh.mp3 / sample-zh-01.mp3 這類檔名取出語言"""
+    langs = ("en", "zh", "ja", "ko", "th")
+    return next(part for part in Path(path).stem.split("-") if part in langs)
+
+
+def percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def peak_rss_mb() -> float:
+    # Linux 的 ru_maxrss 單位是 KB，macOS 是 bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if platform.system() == "Darwin" else 1024)
+
+
+def summarize(latencies: list[float], audio_seconds: float) -> dict:
+    return {
+        "runs": len(latencies),
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "rtf": percentile(latencies, 50) / audio_seconds if audio_seconds else 0.0,
+    }
+
+
+def run_engine(engine: Engine, files: list[str], warmup: int, repeat: int) -> dict:
+    """
+    對單一引擎執行效能測試。
+
+    音檔先經 audio_cache 解碼，計時只包含模型推論。warm-up 在第一個音檔上執行，不列入統計。
+    """
+    print(f"============= {engine.name} {engine.model} ============")
+    with tracer.context(f"{engine.name}-{engine.model}"):
+        return measure_engine(engine, files, warmup, repeat)
+
+
+def measure_engine(engine: Engine, files: list[str], warmup: int, repeat: int) -> dict:
+    start = time.perf_counter()
+    run = engine.load()
+    load_time = time.perf_counter() - start
+    # 引擎載入後 torch 已經 import，這時才 import encoder_cache 不會增加成本
+    from encoder_cache import encoder_cache
+
+    audios = {path: audio_cache.load_audio(path) for path in files}
+    for _ in range(warmup):
+        run(audios[files[0]], files[0])
+
+    file_results = []
+    all_latencies = []
+    total_audio = 0.0
+    for path in files:
+        audio_seconds = len(audios[path]) / audio_cache.SAMPLE_RATE
+        latencies = []
+        for _ in range(repeat):
+            # 每次都從冷的 encoder 快取開始，否則重複執行只量到 decoder
+            encoder_cache.clear()
+            start = time.perf_counter()
+            run(audios[path], path)
+            latencies.append(time.perf_counter() - start)
+        summary = summarize(latencies, audio_seconds)
+        print(
+            f"{path}: p50={summary['p50']:.2f}s p95={summary['p95']:.2f}s "
+            f"rtf={summary['rtf']:.3f}"
+        )
+        file_results.append(
+            {"filename": path, "audio_seconds": audio_seconds, "latencies": latencies}
+            | summary
+        )
+        all_latencies += latencies
+        total_audio += audio_seconds * repeat
+
+    return {
+        "engine": engine.name,
+        "model": engine.model,
+        "load_time": load_time,
+        # ru_maxrss 是整個行程的峰值，同一次執行測多個引擎時會包含前面引擎的用量
+        "peak_rss_mb": peak_rss_mb(),
+        "summary": summarize(all_latencies, 0)
+        | {"rtf": sum(all_latencies) / total_audio if total_audio else 0.0},
+        "files": file_results,
+    }
+
+
+def load_baseline(path: str) -> dict[tuple[str, str], float]:
+    """
+    讀取比較基準，回傳 (model, filename) 對應的秒數。
+
+    JSON 為本工具先前的輸出，取每個檔案的 p50；CSV 為 asr1 / whisper_v3 / m4t_pipeline
+    寫出的格式，取 Transcription Time 與 Translation Time 的總和。
+    """
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as file:
+            report = json.load(file)
+        return {
+            (result["model"], item["filename"]): item["p50"]
+            for result in report["results"]
+            for item in result["files"]
+        }
+
+    baseline = {}
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            seconds = sum(
+                float(row[column] or 0)
+                for column in ("Transcription Time", "Translation Time")
+                if column in row
+            )
+            baseline[(row["Model"], row["Filename"])] = seconds
+    return baseline
+
+
+def diff_against_baseline(results: list[dict], baseline: dict) -> list[dict]:
+    rows = []
+    for result in results:
+        for item in result["files"]:
+            key = (result["model"], item["filename"])
+            if key not in baseline:
+                continue
+            before = baseline[key]
+            rows.append(
+                {
+                    "model": result["model"],
+                    "filename": item["filename"],
+                    "baseline": before,
+                    "current": item["p50"],
+                    "change": (item["p50"] - before) / before if before else None,
+                }
+            )
+    return rows
+
+
+def print_diff(rows: list[dict]):
+    print(f"{'Model':<32} {'Filename':<32} {'Baseline':>9} {'Current':>9} {'Change':>8}")
+    for row in rows:
+        change = f"{row['change']:+.0%}" if row["change"] is not None else "n/a"
+        print(
+            f"{row['model']:<32} {row['filename']:<32} "
+            f"{row['baseline']:>8.2f}s {row['current']:>8.2f}s {change:>8}"
+        )
+
+
+def build_engines(names: list[str], model_sizes: list[str]) -> list[Engine]:
+    engines = []
+    for name in names:
+        if name == "whisper":
+            engines += [whisper_engine(size) for size in model_sizes]
+        elif name == "whisper-translate":
+            engines += [whisper_translate_engine(size) for size in model_sizes]
+        elif name == "whisper-assisted":
+            engines.append(whisper_assisted_engine())
+        elif name == "m4t":
+            engines.append(m4t_engine())
+        elif name == "m4t-direct":
+            engines.append(m4t_direct_engine())
+    return engines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ASR/translation engines.")
+    parser.add_argument("--engine", nargs="+", choices=ENGINES, default=["whisper"])
+    parser.add_argument(
+        "--model-sizes", nargs="+", default=["tiny", "small", "medium", "large-v3"]
+    )
+    parser.add_argument("--files", default="test-data/*.mp3", help="Glob of audio files.")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON output path (default: dist/bench-*.json).")
+    parser.add_argument("--baseline", help="Previous JSON result or results CSV.")
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write a Chrome trace of every stage to PATH and print a summary.",
+    )
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enable()
+
+    files = sorted(glob.glob(args.files))
+    if not files:
+        parser.error(f"No audio files match {args.files}")
+
+    results = [
+        run_engine(engine, files, args.warmup, args.repeat)
+        for engine in build_engines(args.engine, args.model_sizes)
+    ]
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "config": {"warmup": args.warmup, "repeat": args.repeat, "files": files},
+        "results": results,
+    }
+    if args.baseline:
+        report["baseline"] = args.baseline
+        report["diff"] = diff_against_baseline(results, load_baseline(args.baseline))
+        print_diff(report["diff"])
+
+    output = args.output or f"dist/bench-{time.strftime('%Y%m%d-%H%M')}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Wrote {output}")
+    if args.trace:
+        tracer.print_summary()
+        tracer.export(args.trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+文件模式翻譯：斷句、依長度分組批次翻譯，並依原本的順序串流輸出。
+
+整份文件當成一個序列送進模型會被截斷，attention 的成本也隨長度平方成長；
+斷成句子後，長度相近的句子放在同一個批次，padding 最少。
+"""
+
+import re
+import time
+from collections.abc import Iterator
+
+# 句尾標點 (含全形) 後面可能接著的右引號與右括號
+CLOSING = "\"'”’」』）)】》"
+SENTENCE_END = re.compile(
+    rf"[。！？!?…]+[{CLOSING}]*"  # 中日文與驚嘆/問號，後面不需要空白
+    rf"|(?<=[^\s.])\.[{CLOSING}]*(?=\s)"  # 英文句點，後面要有空白以避開小數點與縮寫中間
+    r"|\n+"  # 換行一律斷開，保留段落
+    r"|(?<=[\u0e00-\u0e7f])[ \t]+(?=[\u0e00-\u0e7f])"  # 泰文以空白分隔句子
+)
+# 句子之間不加空白的目標語言；泰文的句子之間仍以空白分隔，所以不在此列
+NO_SPACE_LANGS = {"zh", "ja"}
+
+
+def split_sentences(text: str) -> list[tuple[str, str]]:
+    """
+    把文本切成句子。
+
+    Returns:
+        list[tuple[str, str]]: (句子, 句子後面的分隔字元)；
+            把每一組串接起來就是原文，翻譯後以同樣的分隔字元重組
+    """
+    pieces = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        if match.start() < start:
+            # 已經被前一個分隔字元涵蓋的換行或空白
+            continue
+        # 標點屬於句子，標點之後的空白與換行屬於分隔字元
+        punctuation = match.group().rstrip()
+        end = match.start() + len(punctuation)
+        separator_end = match.end()
+        while separator_end < len(text) and text[separator_end] in " \t\n":
+            separator_end += 1
+        pieces.append((text[start:end], text[end:separator_end]))
+        start = separator_end
+    if start < len(text):
+        pieces.append((text[start:], ""))
+
+    sentences = []
+    for sentence, separator in pieces:
+        if sentence.strip():
+            sentences.append((sentence.strip(), separator))
+        elif sentences:
+            # 連續的標點或空白併入前一句的分隔字元
+            previous, previous_separator = sentences[-1]
+            sentences[-1] = (previous, previous_separator + sentence + separator)
+    return sentences
+
+
+def target_separator(separator: str, target_lang: str, last: bool) -> str:
+    """把原文的句間分隔換成目標語言的習慣：換行保留，空白依目標語言增減"""
+    if "\n" in separator or last:
+        return separator
+    return "" if target_lang in NO_SPACE_LANGS else " "
+
+
+def length_batches(sentences: list[str], batch_size: int) -> list[list[int]]:
+    """
+    依長度排序後每 batch_size 句一組，回傳每組句子的索引。
+
+    批次依其中最前面的句子排序，讓文件開頭最先翻完、可以先輸出。
+    """
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+    batches = [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+    return sorted(batches, key=min)
+
+
+def translate_document(
+    translator,
+    text: str,
+    source_lang: str,
+    target_lang: str,
+    batch_size: int = 16,
+    stats: dict | None = None,
+) -> Iterator[str]:
+    """
+    翻譯整份文件，依原文順序逐段產生翻譯結果。
+
+    每個批次翻完後，輸出所有前面句子都已翻完的部分，所以可以直接串流到 stdout。
+
+    Args:
+        translator: 有 translate_batch 的翻譯器
+        text (str): 文件內容
+        source_lang (str): 來源語言
+        target_lang (str): 目標語言
+        batch_size (int): 每個批次的句子數
+        stats (dict | None): 傳入時填入 sentences、seconds 與 sentences_per_second
+
+    Yields:
+        str: 翻譯後的句子加上分隔字元
+    """
+    start = time.perf_counter()
+    sentences = split_sentences(text)
+    sources = [sentence for sentence, _ in sentences]
+    translations: list[str | None] = [None] * len(sentences)
+    emitted = 0
+    for batch in length_batches(sources, batch_size):
+        results = translator.translate_batch(
+            [sources[i] for i in batch], source_lang, target_lang
+        )
+        for i, translated in zip(batch, results):
+            translations[i] = translated
+        while emitted < len(sentences) and translations[emitted] is not None:
+            last = emitted == len(sentences) - 1
+            separator = target_separator(sentences[emitted][1], target_lang, last)
+            yield translations[emitted] + separator
+            emitted += 1
+
+    if stats is not None:
+        seconds = time.perf_counter() - start
+        stats["sentences"] = len(sentences)
+        stats["seconds"] = seconds
+        stats["sentences_per_second"] = len(sentences) / seconds if seconds else 0.0
@@ -0,0 +1,219 @@
+"""
+Whisper 的 log-mel 與 encoder 輸出快取。
+
+同一段音訊以不同的解碼選項重跑時 (指定或自動偵測語言、transcribe / translate、
+temperature fallback)，log-mel 與 encoder 的結果都相同，只有 decoder 需要重跑。
+
+- log-mel 以音訊內容的 sha256 與 n_mels 為鍵
+- encoder 輸出以 checkpoint 與 30 秒 mel 視窗內容的 sha256 為鍵；install() 包裝
+  model.encoder，所以 model.transcribe、whisper.decode 與 whisper_decode 都會用到
+
+快取在記憶體中依 LRU 淘汰，設定 spill_dir 時淘汰的項目寫到磁碟，之後命中時再讀回。
+
+環境變數：ENCODER_CACHE_MB (記憶體上限，預設 1024，0 表示停用)、ENCODER_CACHE_DIR (spill 目錄)
+"""
+
+import hashlib
+import importlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from tracing import tracer
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups else 0.0
+
+
+def content_hash(data: np.ndarray | torch.Tensor) -> str:
+    if isinstance(data, torch.Tensor):
+        data = data.detach().cpu().contiguous().numpy()
+    return hashlib.sha256(np.ascontiguousarray(data).view(np.uint8)).hexdigest()
+
+
+class EncoderCache:
+    """
+    以 LRU 淘汰的 tensor 快取，mel 與 encoder 輸出各自統計命中率。
+
+    使用方法：
+    1. encoder_cache.install(model, checkpoint) 讓 model.encoder 經過快取
+    2. encoder_cache.mel(audio, n_mels, padding) 取得 (快取的) log-mel
+    3. encoder_cache.stats() 查看命中率與記憶體用量
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: Path | None = None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.entries: OrderedDict[str, tuple[str, torch.Tensor]] = OrderedDict()
+        self.bytes = 0
+        self.kind_stats = {"mel": CacheStats(), "encoder": CacheStats()}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def spill_path(self, key: str) -> Path:
+        return self.spill_dir / f"{key}.pt"
+
+    def get(self, kind: str, key: str) -> torch.Tensor | None:
+        stats = self.kind_stats[kind]
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                stats.hits += 1
+                return self.entries[key][1]
+        if self.spill_dir and self.spill_path(key).exists():
+            tensor = torch.load(self.spill_path(key))
+            stats.disk_hits += 1
+            self.put(kind, key, tensor, spill=False)
+            return tensor
+        stats.misses += 1
+        return None
+
+    def put(self, kind: str, key: str, tensor: torch.Tensor, spill: bool = True):
+        size = tensor.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (kind, tensor)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                evicted_key, (evicted_kind, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.kind_stats[evicted_kind].evictions += 1
+                if spill and self.spill_dir:
+                    self.spill_dir.mkdir(parents=True, exist_ok=True)
+                    path = self.spill_path(evicted_key)
+                    if not path.exists():
+                        torch.save(evicted.cpu(), path)
+
+    def mel(
+        self, audio: np.ndarray, n_mels: int, padding: int = 0
+    ) -> torch.Tensor:
+        """與 whisper.log_mel_spectrogram 相同，但以音訊內容為鍵快取結果"""
+        import whisper
+
+        if not self.enabled:
+            with tracer.span("whisper.mel", "whisper"):
+                return whisper.log_mel_spectrogram(
+                    audio, n_mels=n_mels, padding=padding
+                )
+        key = "mel-" + content_hash(audio) + f"-{n_mels}-{padding}"
+        mel = self.get("mel", key)
+        if mel is None:
+            with tracer.span("whisper.mel", "whisper"):
+                mel = whisper.log_mel_spectrogram(audio, n_mels=n_mels, padding=padding)
+            self.put("mel", key, mel)
+        return mel
+
+    def encode(self, checkpoint: str, encoder, mel: torch.Tensor) -> torch.Tensor:
+        """逐個 30 秒視窗查詢快取，只把未命中的視窗送進 encoder"""
+        if not self.enabled:
+            return encoder(mel)
+        keys = [f"enc-{checkpoint}-{content_hash(window)}" for window in mel]
+        outputs = [self.get("encoder", key) for key in keys]
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        if missing:
+            computed = encoder(mel[missing])
+            for i, output in zip(missing, computed):
+                outputs[i] = output
+                self.put("encoder", keys[i], output)
+        return torch.stack([output.to(mel.device) for output in outputs])
+
+    def install(self, model, checkpoint: str):
+        """
+        讓 model.encoder 經過快取，checkpoint 用來區分不同模型的 encoder 輸出。
+
+        whisper.decode 與 detect_language 直接呼叫 model.encoder，所以包裝 encoder 的
+        forward 而不是 model.embed_audio。
+        """
+        model.checkpoint = checkpoint
+        forward = model.encoder.forward
+        model.encoder.forward = lambda mel: self.encode(checkpoint, forward, mel)
+        return model
+
+    @contextmanager
+    def cached_mel(self):
+        """在 with 區塊內讓 model.transcribe 使用快取的 log-mel"""
+        transcribe_module = importlib.import_module("whisper.transcribe")
+        original = transcribe_module.log_mel_spectrogram
+
+        def log_mel_spectrogram(audio, n_mels=80, padding=0, device=None):
+            if isinstance(audio, np.ndarray):
+                mel = self.mel(audio, n_mels, padding)
+                return mel.to(device) if device is not None else mel
+            return original(audio, n_mels, padding, device)
+
+        transcribe_module.log_mel_spectrogram = log_mel_spectrogram
+        try:
+            yield
+        finally:
+            transcribe_module.log_mel_spectrogram = original
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "memory_mb": self.bytes / 1024**2,
+            "max_mb": self.max_bytes / 1024**2,
+            "spill_dir": str(self.spill_dir) if self.spill_dir else None,
+            **{
+                kind: {
+                    "hits": stats.hits,
+                    "disk_hits": stats.disk_hits,
+                    "misses": stats.misses,
+                    "evictions": stats.evictions,
+                    "hit_rate": stats.hit_rate,
+                }
+                for kind, stats in self.kind_stats.items()
+            },
+        }
+
+    def print_stats(self) -> None:
+        stats = self.stats()
+        print(
+            f"Encoder cache: {stats['entries']} entries, "
+            f"{stats['memory_mb']:.0f}MB of {stats['max_mb']:.0f}MB"
+        )
+        for kind in self.kind_stats:
+            kind_stats = stats[kind]
+            print(
+                f"  {kind}: hit rate {kind_stats['hit_rate']:.1%} "
+                f"(hits={kind_stats['hits']} disk={kind_stats['disk_hits']} "
+                f"misses={kind_stats['misses']} evictions={kind_stats['evictions']})"
+            )
+
+
+def default_cache() -> EncoderCache:
+    spill_dir = os.environ.get("ENCODER_CACHE_DIR")
+    return EncoderCache(
+        max_bytes=int(float(os.environ.get("ENCODER_CACHE_MB", 1024)) * 1024**2),
+        spill_dir=Path(spill_dir) if spill_dir else None,
+    )
+
+
+# 整個行程共用的快取
+encoder_cache = default_cache()
@@ -1,6 +1,49 @@
 import argparse
-from m2m100 import M2M100Translator
-from mbart import MBARTTranslator
+import sys
+
+import fy_server
+
+# 與 M2M100Translator / MBARTTranslator 的 LANG_CODES 相同，避免為了列出語言而載入 transformers
+LANGS = ["zh", "en", "ja", "ko", "th"]
+
+
+def translate_in_process(args, target_langs):
+    translator = fy_server.load_translator(
+        args.model,
+        use_cache=not args.no_cache,
+        quantize=args.quantize,
+        backend=args.backend,
+    )
+    return translator.translate_many(args.text, args.lang, target_langs)
+
+
+def translate_file(args, target_langs):
+    """文件模式：斷句後批次翻譯，每翻完一批就輸出已經可以依序輸出的句子"""
+    if args.file == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.file, encoding="utf-8") as file:
+            text = file.read()
+
+    translator = fy_server.load_translator(
+        args.model,
+        use_cache=not args.no_cache,
+        quantize=args.quantize,
+        backend=args.backend,
+    )
+    for lang in target_langs:
+        stats = {}
+        print(f"== {lang} ==")
+        for piece in translator.translate_document(
+            text, args.lang, lang, batch_size=args.batch_size, stats=stats
+        ):
+            print(piece, end="", flush=True)
+        print()
+        print(
+            f"{lang}: {stats['sentences']} sentences in {stats['seconds']:.1f}s "
+            f"({stats['sentences_per_second']:.1f} sentences/s)",
+            file=sys.stderr,
+        )
 
 
 def main():
@@ -14,21 +57,69 @@ def main():
         choices=["m2m100", "mbart"],
         help="Translation model to use.",
     )
-    parser.add_argument("text", help="Text to translate.")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk translation cache.",
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=fy_server.QUANTIZE_CHOICES,
+        help="Run the model with dynamic int8 quantization (CPU only).",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=fy_server.BACKEND_CHOICES,
+        default="eager",
+        help="Inference backend: eager PyTorch, torch.compile or onnxruntime.",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Load the model in this process instead of using the fy daemon.",
+    )
+    parser.add_argument(
+        "--file",
+        help="Translate a whole document sentence by sentence ('-' reads stdin).",
+    )
+    parser.add_argument(
+        "--to",
+        nargs="+",
+        choices=LANGS,
+        help="Target languages (default: all other supported languages).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=16,
+        help="Sentences per batch in document mode.",
+    )
+    parser.add_argument("text", nargs="?", help="Text to translate.")
 
     args = parser.parse_args()
+    if (args.text is None) == (args.file is None):
+        parser.error("give either a text argument or --file")
 
-    if args.model == "m2m100":
-        translator = M2M100Translator()
-    elif args.model == "mbart":
-        translator = MBARTTranslator()
-
-    translations = {}
-    for target_lang in translator.LANG_CODES.keys():
-        if args.lang != target_lang:
-            translated_text = translator.translate(args.text, args.lang, target_lang)
-            print(f"🟥[1]: fy.py:21: lang={args.lang} text={translated_text}")
-            translations[target_lang] = translated_text
+    target_langs = args.to or [lang for lang in LANGS if lang != args.lang]
+    if args.file:
+        translate_file(args, target_langs)
+        return
+    if args.no_daemon:
+        translations = translate_in_process(args, target_langs)
+    else:
+        try:
+            translations = fy_server.translate_many(
+                args.model,
+                args.text,
+                args.lang,
+                target_langs,
+                use_cache=not args.no_cache,
+                quantize=args.quantize,
+                backend=args.backend,
+            )
+        except fy_server.DaemonUnavailable as e:
+            print(f"fy daemon unavailable ({e}), translating in-process", file=sys.stderr)
+            translations = translate_in_process(args, target_langs)
 
     print(f"{args.lang}: {args.text},")
     for lang, translation in translations.items():
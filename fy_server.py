@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from kv_cache import DEFAULT_CACHE_DIR
+
+# 與 quantize.QUANTIZE_CHOICES 相同，避免 client 端為了參數檢查而載入 torch
+QUANTIZE_CHOICES = ["int8"]
+# 與 translation_backend.BACKENDS 相同
+BACKEND_CHOICES = ["eager", "compile", "onnx"]
+
+DEFAULT_SOCKET_PATH = DEFAULT_CACHE_DIR / "fy.sock"
+DEFAULT_LOG_PATH = DEFAULT_CACHE_DIR / "fy-server.log"
+# 等待背景 daemon 建立 socket 的時間（模型是在第一個請求時才載入）
+STARTUP_TIMEOUT = 10.0
+
+
+class DaemonUnavailable(Exception):
+    """無法連線或啟動翻譯 daemon"""
+
+
+class DaemonAlreadyRunning(Exception):
+    """socket 上已經有另一個 daemon 在執行"""
+
+
+def socket_in_use(socket_path: Path) -> bool:
+    """socket 上有 daemon 回應 ping；不存在或殘留的 socket 檔案回傳 False"""
+    try:
+        send_request({"command": "ping"}, socket_path)
+    except DaemonUnavailable:
+        return False
+    return True
+
+
+def load_translator(
+    model: str,
+    use_cache: bool = True,
+    quantize: str | None = None,
+    backend: str = "eager",
+):
+    """依名稱建立翻譯器並包上翻譯快取；backend 見 translation_backend"""
+    from translation_cache import CachedTranslator
+
+    if model == "m2m100":
+        from m2m100 import M2M100Translator
+
+        translator = M2M100Translator(quantize=quantize, backend=backend)
+    elif model == "mbart":
+        from mbart import MBARTTranslator
+
+        translator = MBARTTranslator(quantize=quantize, backend=backend)
+    else:
+        raise ValueError(f"Unknown model: {model}")
+    return CachedTranslator(translator, enabled=use_cache)
+
+
+class TranslationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    常駐的翻譯服務，保留已載入的 M2M100Translator / MBARTTranslator。
+
+    協定：每個連線送出一行 JSON 請求，回傳一行 JSON 回應。
+    - {"command": "translate", "model", "quantize", "backend", "text",
+       "source_lang", "target_langs", "use_cache"}
+    - {"command": "ping"}
+    - {"command": "shutdown"}
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path):
+        self.socket_path = socket_path
+        self.translators = {}
+        # 模型推論不保證執行緒安全，同一模型的請求依序處理
+        self.locks = {}
+        self.registry_lock = threading.Lock()
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        # 兩個 client 同時自動啟動 daemon 時，後啟動的不能搶走仍在服務的 socket
+        if socket_in_use(socket_path):
+            raise DaemonAlreadyRunning(f"a daemon is listening on {socket_path}")
+        # 只移除上一個 daemon 異常結束時殘留的 socket 檔案
+        socket_path.unlink(missing_ok=True)
+        super().__init__(str(socket_path), TranslationRequestHandler)
+
+    def get_translator(
+        self, model: str, quantize: str | None = None, backend: str = "eager"
+    ):
+        key = (model, quantize, backend)
+        with self.registry_lock:
+            if key not in self.locks:
+                self.locks[key] = threading.Lock()
+            lock = self.locks[key]
+        with lock:
+            if key not in self.translators:
+                self.translators[key] = load_translator(
+                    model, quantize=quantize, backend=backend
+                )
+        return self.translators[key], lock
+
+    def handle_request_payload(self, payload: dict) -> dict:
+        command = payload.get("command", "translate")
+        if command == "ping":
+            models = [
+                f"{model}:{quantize or 'fp32'}:{backend}"
+                for model, quantize, backend in self.translators
+            ]
+            return {"status": "ok", "models": sorted(models)}
+        if command == "shutdown":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"status": "ok"}
+        if command != "translate":
+            raise ValueError(f"Unknown command: {command}")
+
+        translator, lock = self.get_translator(
+            payload["model"], payload.get("quantize"), payload.get("backend", "eager")
+        )
+        with lock:
+            translator.enabled = payload.get("use_cache", True)
+            translations = translator.translate_many(
+                payload["text"], payload["source_lang"], payload["target_langs"]
+            )
+        return {"translations": translations}
+
+    def server_close(self):
+        super().server_close()
+        self.socket_path.unlink(missing_ok=True)
+
+
+class TranslationRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            response = self.server.handle_request_payload(json.loads(line))
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+
+
+def send_request(payload: dict, socket_path: Path = DEFAULT_SOCKET_PATH) -> dict:
+    """
+    傳送一個請求給 daemon 並等待回應。
+
+    Raises:
+        DaemonUnavailable: 無法連線到 daemon
+        RuntimeError: daemon 處理請求時發生錯誤
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(socket_path))
+            client.sendall(json.dumps(payload, ensure_ascii=False).encode() + b"\n")
+            with client.makefile("rb") as reader:
+                line = reader.readline()
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise DaemonUnavailable(str(e)) from e
+    if not line:
+        raise DaemonUnavailable("daemon closed the connection")
+
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response
+
+
+def start_daemon(socket_path: Path = DEFAULT_SOCKET_PATH) -> None:
+    """
+    在背景啟動 daemon，並等待 socket 可以連線。
+
+    Raises:
+        DaemonUnavailable: 在 STARTUP_TIMEOUT 內 daemon 沒有就緒
+    """
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(DEFAULT_LOG_PATH, "ab") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--socket", str(socket_path)],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            send_request({"command": "ping"}, socket_path)
+            return
+        except DaemonUnavailable:
+            time.sleep(0.1)
+    raise DaemonUnavailable(f"daemon did not start within {STARTUP_TIMEOUT}s")
+
+
+def translate_many(
+    model: str,
+    text: str,
+    source_lang: str,
+    target_langs: list[str],
+    use_cache: bool = True,
+    quantize: str | None = None,
+    backend: str = "eager",
+    socket_path: Path = DEFAULT_SOCKET_PATH,
+) -> dict[str, str]:
+    """透過 daemon 翻譯，daemon 尚未執行時先啟動它"""
+    payload = {
+        "command": "translate",
+        "model": model,
+        "quantize": quantize,
+        "backend": backend,
+        "text": text,
+        "source_lang": source_lang,
+        "target_langs": target_langs,
+        "use_cache": use_cache,
+    }
+    try:
+        return send_request(payload, socket_path)["translations"]
+    except DaemonUnavailable:
+        start_daemon(socket_path)
+        return send_request(payload, socket_path)["translations"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident translation daemon for fy.")
+    parser.add_argument("--socket", type=Path, default=DEFAULT_SOCKET_PATH)
+    parser.add_argument(
+        "--preload",
+        nargs="*",
+        default=[],
+        choices=["m2m100", "mbart"],
+        help="Models to load before accepting requests.",
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=QUANTIZE_CHOICES,
+        help="Quantization mode for the preloaded models.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKEND_CHOICES,
+        default="eager",
+        help="Inference backend for the preloaded models.",
+    )
+    parser.add_argument(
+        "--stop", action="store_true", help="Stop the running daemon and exit."
+    )
+    args = parser.parse_args()
+
+    if args.stop:
+        send_request({"command": "shutdown"}, args.socket)
+        return
+
+    try:
+        server = TranslationServer(args.socket)
+    except DaemonAlreadyRunning as e:
+        # 已有 daemon 在服務，start_daemon 的 ping 會連到它
+        print(e, flush=True)
+        return
+
+    with server:
+        for model in args.preload:
+            server.get_translator(model, args.quantize, args.backend)
+        print(f"fy server listening on {args.socket}", flush=True)
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# 所有本機快取檔案的預設存放位置
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "speech-translate"
+
+
+def make_key(*parts) -> str:
+    """
+    將多個欄位組合成固定長度的快取鍵。
+
+    Args:
+        *parts: 任意可 JSON 序列化的欄位
+
+    Returns:
+        str: sha256 十六進位字串
+    """
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SqliteLRUCache:
+    """
+    以 SQLite 為儲存的本機 key-value 快取。
+
+    主要功能：
+    1. 以字串鍵存取 JSON 值，跨行程保存
+    2. 限制最大筆數，超過時依最後存取時間做 LRU 淘汰
+    3. 記錄命中/未命中次數
+    """
+
+    def __init__(self, path: str | Path, max_entries: int = 100_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0);
+            """
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        """取得快取值，不存在時回傳 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            counter = "hits" if row else "misses"
+            self._conn.execute(
+                "UPDATE counters SET value = value + 1 WHERE name = ?", (counter,)
+            )
+            if row:
+                self._conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            self._conn.commit()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value) -> None:
+        """寫入快取值，超過筆數上限時淘汰最久未使用的項目"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    """
+                    DELETE FROM entries WHERE key IN (
+                        SELECT key FROM entries ORDER BY last_access LIMIT ?
+                    )
+                    """,
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """回傳筆數與命中率統計"""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters"))
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
@@ -1,9 +1,22 @@
-from transformers import pipeline
+import argparse
+import os
 import sys
+import threading
 import time
 import csv
+from dataclasses import dataclass
 
-from transformers.configuration_utils import re
+import torch
+
+import numpy as np
+
+import audio_cache
+import thread_planner
+from asr_cache import asr_cache
+from pipeline_stages import Pipeline, Stage
+import vad as voice_activity
+from model_registry import registry
+from tracing import instrument_seq2seq, tracer
 
 
 class Record:
@@ -16,6 +29,8 @@ class Record:
         transcription_time: float = 0,
         transcription: str = "",
         translation: str = "",
+        direct_translation: str = "",
+        direct_translation_time: float = 0,
     ):
         self.model = model
         self.filename = filename
@@ -24,6 +39,8 @@ class Record:
         self.transcription_time = transcription_time
         self.translation = translation
         self.transcription = transcription
+        self.direct_translation = direct_translation
+        self.direct_translation_time = direct_translation_time
 
     def display_info(self):
         print(f"Model: {self.model}")
@@ -33,41 +50,222 @@ class Record:
         print(f"Transcriiption Time: {self.transcription_time}")
         print(f"Transcription: {self.transcription}")
         print(f"translation: {self.translation}")
+        print(f"Direct Translation Time: {self.direct_translation_time}")
+        print(f"Direct Translation: {self.direct_translation}")
 
 
 # "https://huggingface.co/datasets/Narsil/asr_dummy/resolve/main/mlk.flac"
 
 model_name = "facebook/seamless-m4t-v2-large"
-# device = -1  # -1 for CPU
-device = 0  # 0 for CUDA
-transcriber = pipeline(
-    task="automatic-speech-recognition", model=model_name, device=device
-)
-translator = pipeline(task="translation", model=model_name, device=-1)
+# 測試資料檔名中的語言對應到 SeamlessM4T 的語言代碼
+LANG_CODES = {"en": "eng", "zh": "cmn_Hant", "ja": "jpn", "ko": "kor", "th": "tha"}
+# 執行裝置，None 表示有 CUDA 時用 GPU、否則用 CPU；可用 M4T_DEVICE 環境變數或 --device 指定
+device = os.environ.get("M4T_DEVICE")
+# SeamlessM4Tv2Model.generate 會依輸入設定 current_modality 與 main_input_name，
+# 語音與文字輸入同時呼叫時會互相覆寫，所以共用模型的 generate 一次只執行一個
+generate_lock = threading.Lock()
 
 
-def transcribe(audio_file: str, target_lang: str = "eng"):
-    try:
-        transcription = transcriber(
-            audio_file, generate_kwargs={"tgt_lang": target_lang}
+def get_device() -> str:
+    return device or ("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def get_processor():
+    from transformers import AutoProcessor
+
+    return registry.get(
+        ("processor", model_name), lambda: AutoProcessor.from_pretrained(model_name)
+    )
+
+
+def get_model():
+    """
+    取得共用的 SeamlessM4Tv2Model。
+
+    ASR、文字翻譯與語音直譯 (S2TT) 都使用同一個模型，第一次呼叫時才載入。
+    """
+    return registry.get(("model", model_name, get_device()), load_model)
+
+
+def load_model():
+    # transformers 在第一次載入模型時才 import，只用到 Record 或常數時不必付出這個成本
+    from transformers import SeamlessM4Tv2Model
+
+    model = SeamlessM4Tv2Model.from_pretrained(model_name).to(get_device()).eval()
+    if get_device() == "cpu":
+        thread_planner.configure(model_name, model)
+    return instrument_seq2seq(model, "m4t")
+
+
+def generate_text(inputs, tgt_lang: str) -> str:
+    """以 SeamlessM4Tv2Model 產生 tgt_lang 的文字 (不產生語音)"""
+    with generate_lock, torch.no_grad():
+        output_tokens = get_model().generate(
+            **inputs.to(get_device()), tgt_lang=tgt_lang, generate_speech=False
+        )
+    with tracer.span("m4t.detokenize", "m4t"):
+        return get_processor().decode(
+            output_tokens[0].tolist()[0], skip_special_tokens=True
         )
+
+
+def load_speech(audio_file: str | np.ndarray, vad: bool = False):
+    """讀取音訊並轉成模型輸入，vad=True 時先剔除靜音；沒有語音時回傳 (None, VadResult)"""
+    audio = audio_cache.load_audio(audio_file)
+    speech = None
+    if vad:
+        speech = voice_activity.detect_speech(audio)
+        audio = speech.compact(audio)
+        if not speech.regions:
+            return None, speech
+    with tracer.span("m4t.features", "m4t"):
+        inputs = get_processor()(
+            audios=np.asarray(audio),
+            sampling_rate=audio_cache.SAMPLE_RATE,
+            return_tensors="pt",
+        )
+    return inputs, speech
+
+
+def transcribe(
+    audio_file: str | np.ndarray, target_lang: str = "eng", vad: bool = False
+):
+    """
+    轉錄音檔，audio_file 可以是路徑或 audio_cache.load_audio 的 16 kHz 陣列。
+    vad=True 時先剔除靜音，只把語音區段送進模型。
+    """
+    try:
+        inputs, speech = load_speech(audio_file, vad)
+        if inputs is None:
+            print(speech.report(0))
+            return {"text": ""}
+
+        start_time = time.time()
+        transcription = {"text": generate_text(inputs, target_lang)}
+        if vad:
+            print(speech.report(time.time() - start_time))
         return transcription
     except Exception as e:
         print(f"Error transcribing {audio_file}: {str(e)}", file=sys.stderr)
         return None
 
 
-def translate(text: str, src_lang: str) -> str:
-    """Translate text to English"""
+def translate(text: str, src_lang: str) -> str | None:
+    """Translate text to English; returns None on failure"""
     try:
-        translation = translator(
-            text, src_lang=src_lang, tgt_lang="eng", max_length=400
-        )
-
-        return translation[0].get("translation_text", "")
+        with tracer.span("m4t.tokenize", "m4t"):
+            inputs = get_processor()(text=text, src_lang=src_lang, return_tensors="pt")
+        return generate_text(inputs, "eng")
     except Exception as e:
         print(f"Error translating text: {str(e)}", file=sys.stderr)
-        return text
+        return None
+
+
+def speech_to_english(audio_file: str | np.ndarray, vad: bool = False) -> str | None:
+    """
+    直接將語音翻譯成英文文字 (S2TT)，不經過先轉錄再翻譯的中間步驟。
+    失敗時回傳 None，與 transcribe 相同。
+    """
+    try:
+        inputs, speech = load_speech(audio_file, vad)
+        if inputs is None:
+            print(speech.report(0))
+            return ""
+        return generate_text(inputs, "eng")
+    except Exception as e:
+        print(f"Error translating {audio_file}: {str(e)}", file=sys.stderr)
+        return None
+
+
+@dataclass
+class SpeechTranslation:
+    text: str
+    waveform: np.ndarray | None = None
+    unit_ids: list[int] | None = None
+
+
+def translate_speech_many(
+    audio_file: str | np.ndarray,
+    tgt_langs: list[str],
+    generate_speech: list[str] | None = None,
+) -> dict[str, SpeechTranslation]:
+    """
+    將一段語音同時翻譯成多個目標語言。
+
+    speech encoder 只執行一次，encoder 輸出複製成每個目標語言一列，
+    以各自的語言 token 作為 decoder 開頭，在同一次 generate 中批次解碼文字。
+
+    generate_speech 列出的語言另外呼叫一次完整的 generate 取得 speech units 與波形
+    (speech encoder 會再執行一次)，所以只列真正需要語音的語言；文字仍使用批次解碼的結果。
+
+    Args:
+        audio_file (str | np.ndarray): 音檔路徑或 16 kHz 陣列
+        tgt_langs (list[str]): 目標語言代碼，例如 ["eng", "cmn_Hant", "jpn"]
+        generate_speech (list[str] | None): 需要產生語音的目標語言，例如 ["eng"]
+
+    Returns:
+        dict[str, SpeechTranslation]: 目標語言對應的翻譯結果
+    """
+    if not tgt_langs:
+        return {}
+
+    from transformers import SeamlessM4Tv2Model
+
+    model = get_model()
+    processor = get_processor()
+    inputs, _ = load_speech(audio_file)
+    inputs = inputs.to(get_device())
+
+    attention_mask = inputs.get("attention_mask")
+    with generate_lock, torch.no_grad():
+        encoder_outputs = model.speech_encoder(
+            input_features=inputs["input_features"], attention_mask=attention_mask
+        )
+        encoder_outputs.last_hidden_state = (
+            encoder_outputs.last_hidden_state.repeat(len(tgt_langs), 1, 1)
+        )
+        if attention_mask is not None:
+            attention_mask = attention_mask.repeat(len(tgt_langs), 1)
+        # forward 只在 speech 模式下把 attention_mask 換算成 encoder 輸出長度的遮罩，
+        # 上一個 generate 可能是文字輸入，這裡明確設定
+        model.set_modality("speech")
+        # 與 SeamlessM4Tv2Model.generate 相同，decoder 以目標語言 token 開頭
+        decoder_input_ids = torch.tensor(
+            [
+                [model.generation_config.text_decoder_lang_to_code_id[lang]]
+                for lang in tgt_langs
+            ],
+            device=get_device(),
+        )
+        # 直接呼叫 GenerationMixin.generate，帶入已計算好的 encoder 輸出
+        sequences = super(SeamlessM4Tv2Model, model).generate(
+            encoder_outputs=encoder_outputs,
+            attention_mask=attention_mask,
+            decoder_input_ids=decoder_input_ids,
+        )
+    texts = processor.batch_decode(sequences, skip_special_tokens=True)
+    results = {
+        lang: SpeechTranslation(text=text) for lang, text in zip(tgt_langs, texts)
+    }
+
+    speech_langs = model.generation_config.t2u_lang_code_to_id
+    for lang in generate_speech or []:
+        if lang not in results:
+            raise ValueError(f"{lang} is not one of the target languages {tgt_langs}")
+        if lang not in speech_langs:
+            print(f"Speech output is not supported for {lang}", file=sys.stderr)
+            continue
+        with generate_lock, torch.no_grad():
+            output = model.generate(
+                **inputs, tgt_lang=lang, return_intermediate_token_ids=True
+            )
+        waveform = output.waveform[0].cpu().numpy()
+        if output.waveform_lengths is not None:
+            waveform = waveform[: int(output.waveform_lengths[0])]
+        results[lang].waveform = waveform
+        results[lang].unit_ids = output.unit_sequences[0].tolist()
+
+    return results
 
 
 def print_transcription(file: str, lang: str):
@@ -79,29 +277,23 @@ def print_transcription(file: str, lang: str):
 
 
 def process_files():
-    print_transcription("test-data/sample-en-01.mp3", "eng")
-    print_transcription("test-data/sample-zh-01.mp3", "cmn_Hant")
-    print_transcription("test-data/sample-ja-01.mp3", "jpn")
-    print_transcription("test-data/sample-ko-01.mp3", "kor")
-    print_transcription("test-data/sample-th-01.mp3", "tha")
-
-    print_transcription("test-data/serenity-en.mp3", "eng")
-    print_transcription("test-data/serenity-zh.mp3", "cmn_Hant")
-    print_transcription("test-data/serenity-ja.mp3", "jpn")
-    print_transcription("test-data/serenity-ko.mp3", "kor")
-    print_transcription("test-data/serenity-th.mp3", "tha")
-
-    print_transcription("test-data/spiderman-en.mp3", "eng")
-    print_transcription("test-data/spiderman-zh.mp3", "cmn_Hant")
-    print_transcription("test-data/spiderman-ja.mp3", "jpn")
-    print_transcription("test-data/spiderman-ko.mp3", "kor")
-    print_transcription("test-data/spiderman-th.mp3", "tha")
-
-    print_transcription("test-data/thinking-en.mp3", "eng")
-    print_transcription("test-data/thinking-zh.mp3", "cmn_Hant")
-    print_transcription("test-data/thinking-ja.mp3", "jpn")
-    print_transcription("test-data/thinking-ko.mp3", "kor")
-    print_transcription("test-data/thinking-th.mp3", "tha")
+    jobs = [
+        (f"test-data/sample-{lang}-01.mp3", target_lang)
+        for lang, target_lang in LANG_CODES.items()
+    ]
+    for filename in ["serenity", "spiderman", "thinking"]:
+        jobs += [
+            (f"test-data/{filename}-{lang}.mp3", target_lang)
+            for lang, target_lang in LANG_CODES.items()
+        ]
+
+    # 以管線處理，之後檔案的音訊讀取與目前檔案的推論重疊
+    for (file, lang), result in zip(jobs, pipelined_cascade(jobs)):
+        if result:
+            print(
+                f"🟥 lang={lang},trans={result['translation']} "
+                f",text={result['transcription']}"
+            )
 
 
 def write_records_to_csv(records, filename):
@@ -117,6 +309,8 @@ def write_records_to_csv(records, filename):
                 "Transcription Time",
                 "Translation",
                 "Transcription",
+                "Direct Translation Time",
+                "Direct Translation",
             ]
         )
         for record in records:
@@ -129,31 +323,153 @@ def write_records_to_csv(records, filename):
                     record.transcription_time,
                     record.transcription,
                     record.translation,
+                    record.direct_translation_time,
+                    record.direct_translation,
                 ]
             )
 
 
-def test_results(filename):
+def run_cascade(file: str, target_lang: str) -> dict | None:
+    """先轉錄再把文字翻成英文；任一步驟失敗時回傳 None，不寫入快取"""
+    time1 = time.time()
+    result = transcribe(file, target_lang=target_lang)
+    if result is None:
+        return None
+    time2 = time.time()
+    translation = translate(result["text"], target_lang)
+    if translation is None:
+        return None
+    time3 = time.time()
+    return {
+        "transcription": result["text"],
+        "translation": translation,
+        "transcription_time": round(time2 - time1, 1),
+        "translation_time": round(time3 - time2, 1),
+    }
+
+
+def cascade_result(file: str, target_lang: str) -> dict | None:
+    return asr_cache.get_or_run(
+        file,
+        "m4t-cascade",
+        model_name,
+        lambda: run_cascade(file, target_lang),
+        task="transcribe+translate",
+        language=target_lang,
+    )
+
+
+def pipelined_cascade(jobs: list[tuple[str, str]]) -> list[dict | None]:
+    """
+    以 load → asr → translate 管線處理多個 (音檔, 目標語言)，回傳格式與 run_cascade 相同。
+
+    第 N 個檔案在翻譯時，第 N+2 個檔案同時在讀取音訊與計算特徵。
+    asr 與 translate 階段共用同一個 SeamlessM4Tv2Model，generate 會修改模型的
+    current_modality，所以兩者以 generate_lock 輪流執行，不會同時推論。
+    """
+
+    def load(job):
+        file, target_lang = job
+        key = asr_cache.key(
+            file, "m4t-cascade", model_name, "transcribe+translate", target_lang
+        )
+        state = {
+            "key": key,
+            "target_lang": target_lang,
+            "result": asr_cache.lookup(key),
+        }
+        if state["result"] is None:
+            start = time.time()
+            state["inputs"], _ = load_speech(file)
+            state["load_time"] = time.time() - start
+        return state
+
+    def asr(state):
+        if state["result"] is None:
+            start = time.time()
+            state["transcription"] = generate_text(
+                state.pop("inputs"), state["target_lang"]
+            )
+            state["transcription_time"] = state["load_time"] + time.time() - start
+        return state
+
+    def translate_text(state):
+        if state["result"] is None:
+            start = time.time()
+            translation = translate(state["transcription"], state["target_lang"])
+            if translation is None:
+                # 失敗的結果不寫入快取，下次執行時重試
+                return None
+            state["result"] = {
+                "transcription": state["transcription"],
+                "translation": translation,
+                "transcription_time": round(state["transcription_time"], 1),
+                "translation_time": round(time.time() - start, 1),
+            }
+            asr_cache.store(state["key"], state["result"])
+        return state["result"]
+
+    pipeline = Pipeline(
+        [Stage("load", load), Stage("asr", asr), Stage("translate", translate_text)]
+    )
+    results = pipeline.run(jobs)
+    pipeline.print_report()
+    return results
+
+
+def run_direct(file: str) -> dict | None:
+    """直接由語音翻成英文 (S2TT)；失敗時回傳 None，不寫入快取"""
+    time1 = time.time()
+    direct_translation = speech_to_english(file)
+    if direct_translation is None:
+        return None
+    return {
+        "direct_translation": direct_translation,
+        "direct_translation_time": round(time.time() - time1, 1),
+    }
+
+
+def test_results(filename, mode="both", pipelined=False):
+    """
+    轉錄並翻譯測試音檔。
+
+    mode="cascade" 先轉錄再把文字翻成英文，"direct" 直接由語音翻成英文 (S2TT)，
+    "both" 兩種都跑，用來比較兩條路徑的時間。
+    結果存在 ASR 結果快取中，音檔與模型都沒變時直接使用先前的結果與耗時。
+    pipelined=True 時 cascade 以管線執行，之後檔案的音訊讀取與特徵計算和目前檔案的推論重疊。
+    """
+    files = {lang: f"test-data/{filename}-{lang}.mp3" for lang in LANG_CODES}
+    cascade = {}
+    if mode in ("cascade", "both"):
+        jobs = [(files[lang], target_lang) for lang, target_lang in LANG_CODES.items()]
+        if pipelined:
+            results = pipelined_cascade(jobs)
+        else:
+            results = [cascade_result(file, target_lang) for file, target_lang in jobs]
+        cascade = dict(zip(LANG_CODES, results))
+
     records = []
-    langs = ["en", "zh", "ja", "ko", "th"]
-    langs2 = ["eng", "cmn_Hant", "jpn", "kor", "tha"]
-    for lang, target_lang in zip(langs, langs2):
-        file = f"test-data/{filename}-{lang}.mp3"
-        time1 = time.time()
-        result = transcribe(file, target_lang=target_lang)
-        time2 = time.time()
-        transcription = result["text"]
-        translation = translate(transcription, target_lang)
-        time3 = time.time()
-        print(f"🟥 lang={lang},trans={translation} ,text={transcription}")
-        record = Record(
-            model=model_name,
-            filename=file,
-            lang=lang,
-            transcription=transcription,
-            translation=translation,
-            translation_time=round(time3 - time2, 1),
-            transcription_time=round(time2 - time1, 1),
+    for lang, target_lang in LANG_CODES.items():
+        file = files[lang]
+        record = Record(model=model_name, filename=file, lang=lang)
+        if result := cascade.get(lang):
+            record.transcription = result["transcription"]
+            record.translation = result["translation"]
+            record.transcription_time = result["transcription_time"]
+            record.translation_time = result["translation_time"]
+        if mode in ("direct", "both"):
+            result = asr_cache.get_or_run(
+                file,
+                "m4t-direct",
+                model_name,
+                lambda: run_direct(file),
+                task="translate",
+            )
+            if result:
+                record.direct_translation = result["direct_translation"]
+                record.direct_translation_time = result["direct_translation_time"]
+        print(
+            f"🟥 lang={lang},trans={record.translation} ,text={record.transcription}"
         )
         records.append(record)
         record.display_info()
@@ -162,12 +478,51 @@ def test_results(filename):
 
 
 def main():
-    records = test_results("serenity")
-    records += test_results("spiderman")
-    records += test_results("thinking")
+    global device
+
+    parser = argparse.ArgumentParser(description="Transcribe and translate with M4T.")
+    parser.add_argument("--device", help="Device to run on, e.g. cpu or cuda.")
+    parser.add_argument(
+        "--mode", choices=["cascade", "direct", "both"], default="both"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached results and re-run every file.",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Load and featurize upcoming files while the model runs on this one.",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write a Chrome trace of every stage to PATH and print a summary.",
+    )
+    args = parser.parse_args()
+    device = args.device or device
+    asr_cache.refresh = args.refresh
+    if args.trace:
+        tracer.enable()
+
+    records = []
+    with tracer.context(f"m4t-{args.mode}"):
+        for filename in ["serenity", "spiderman", "thinking"]:
+            records += test_results(filename, args.mode, args.pipelined)
     filename = f"dist/m4t-{time.strftime('%Y%m%d-%H%M')}.csv"
     write_records_to_csv(records, filename)
 
+    cascade_time = sum(r.transcription_time + r.translation_time for r in records)
+    direct_time = sum(r.direct_translation_time for r in records)
+    print(f"Cascade (ASR + text translation): {cascade_time:.1f}s")
+    print(f"Direct speech-to-English (S2TT): {direct_time:.1f}s")
+    registry.print_stats()
+    asr_cache.print_stats()
+    if args.trace:
+        tracer.print_summary()
+        tracer.export(args.trace)
+
 
 if __name__ == "__main__":
     # process_files()
@@ -1,5 +1,14 @@
+import argparse
+from collections.abc import Iterator
+
+import torch
 from transformers import MBartForConditionalGeneration, MBart50TokenizerFast
 
+import document
+import thread_planner
+import translation_backend
+from tracing import instrument_seq2seq, tracer
+
 
 class MBARTTranslator:
     """
@@ -16,6 +25,7 @@ class MBARTTranslator:
     """
 
     MODEL_NAME = "facebook/mbart-large-50-many-to-many-mmt"
+    MODEL_REVISION = "main"
     # 支持的語言及其對應的語言代碼
     LANG_CODES = {
         "zh": "zh_CN",
@@ -25,9 +35,36 @@ class MBARTTranslator:
         "th": "th_TH",
     }
 
-    def __init__(self):
-        self.model = MBartForConditionalGeneration.from_pretrained(self.MODEL_NAME)
-        self.tokenizer = MBart50TokenizerFast.from_pretrained(self.MODEL_NAME)
+    # test_translations 使用的測試句子
+    TEST_SENTENCES = {
+        "zh": "今天天气真好。",
+        "en": "The weather is nice today.",
+        "ja": "今日の天気はとても良いです。",
+        "ko": "오늘 날씨가 정말 좋습니다.",
+        "th": "วันนี้อากาศดีจริงๆ",
+    }
+
+    def __init__(self, quantize: str | None = None, backend: str = "eager"):
+        """
+        Args:
+            quantize (str | None): "int8" 時對 Linear 層做動態量化（僅限 CPU）
+            backend (str): "eager"、"compile" (torch.compile) 或 "onnx" (onnxruntime)，
+                見 translation_backend
+        """
+        self.quantize = quantize
+        self.backend = backend
+        self.model = translation_backend.load_model(
+            MBartForConditionalGeneration,
+            self.MODEL_NAME,
+            self.MODEL_REVISION,
+            backend,
+            quantize,
+        )
+        self.tokenizer = MBart50TokenizerFast.from_pretrained(
+            self.MODEL_NAME, revision=self.MODEL_REVISION
+        )
+        thread_planner.configure(self.MODEL_NAME, self.model)
+        instrument_seq2seq(self.model, "mbart", self.tokenizer)
 
     def translate(self, text: str, source_lang: str, target_lang: str) -> str:
         """
@@ -43,7 +80,8 @@ class MBARTTranslator:
             str: 翻譯後的文本
         """
         self.tokenizer.src_lang = self.to_language_code(source_lang)
-        encoded = self.tokenizer(text, return_tensors="pt")
+        with tracer.span("mbart.tokenize", "mbart"):
+            encoded = self.tokenizer(text, return_tensors="pt")
         generated_tokens = self.model.generate(
             **encoded,
             forced_bos_token_id=self.tokenizer.lang_code_to_id[
@@ -54,6 +92,120 @@ class MBARTTranslator:
             0
         ]
 
+    def translate_many(
+        self, text: str, source_lang: str, target_langs: list[str]
+    ) -> dict[str, str]:
+        """
+        將同一段文本一次翻譯成多個目標語言。
+
+        原文只做一次 tokenize 與 encoder 運算，每個目標語言佔批次中的一列，
+        以該列的目標語言 token 作為 forced BOS，在同一個 generate 中批次解碼。
+
+        Args:
+            text (str): 要翻譯的文本
+            source_lang (str): 來源語言
+            target_langs (list[str]): 目標語言列表
+
+        Returns:
+            dict[str, str]: 目標語言對應翻譯後的文本
+        """
+        if not target_langs:
+            return {}
+
+        self.tokenizer.src_lang = self.to_language_code(source_lang)
+        with tracer.span("mbart.tokenize", "mbart"):
+            encoded = self.tokenizer(text, return_tensors="pt").to(self.model.device)
+
+        with torch.no_grad():
+            encoder_outputs = self.model.get_encoder()(**encoded)
+
+        batch_size = len(target_langs)
+        encoder_outputs.last_hidden_state = (
+            encoder_outputs.last_hidden_state.repeat(batch_size, 1, 1)
+        )
+        # generate 的 forced_bos_token_id 只能是單一值，所以直接把每列的
+        # forced BOS 放進 decoder 開頭: [decoder_start, 目標語言 token]
+        decoder_input_ids = torch.tensor(
+            [
+                [
+                    self.model.config.decoder_start_token_id,
+                    self.tokenizer.lang_code_to_id[self.to_language_code(target_lang)],
+                ]
+                for target_lang in target_langs
+            ],
+            device=self.model.device,
+        )
+
+        generated_tokens = self.model.generate(
+            encoder_outputs=encoder_outputs,
+            attention_mask=encoded["attention_mask"].repeat(batch_size, 1),
+            decoder_input_ids=decoder_input_ids,
+            forced_bos_token_id=None,
+        )
+        translations = self.tokenizer.batch_decode(
+            generated_tokens, skip_special_tokens=True
+        )
+        return dict(zip(target_langs, translations))
+
+    def translate_batch(
+        self, texts: list[str], source_lang: str, target_lang: str
+    ) -> list[str]:
+        """
+        將多段同語言的文本以一個 padding 後的批次翻譯成同一個目標語言。
+
+        Args:
+            texts (list[str]): 要翻譯的文本
+            source_lang (str): 來源語言
+            target_lang (str): 目標語言
+
+        Returns:
+            list[str]: 與 texts 順序相同的翻譯結果
+        """
+        if not texts:
+            return []
+
+        self.tokenizer.src_lang = self.to_language_code(source_lang)
+        with tracer.span("mbart.tokenize", "mbart"):
+            encoded = self.tokenizer(texts, return_tensors="pt", padding=True).to(
+                self.model.device
+            )
+        generated_tokens = self.model.generate(
+            **encoded,
+            forced_bos_token_id=self.tokenizer.lang_code_to_id[
+                self.to_language_code(target_lang)
+            ],
+        )
+        return self.tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+
+    def translate_document(
+        self,
+        text: str,
+        source_lang: str,
+        target_lang: str,
+        batch_size: int = 16,
+        stats: dict | None = None,
+    ) -> Iterator[str]:
+        """
+        斷句後以長度相近的句子組成批次翻譯，依原文順序逐句產生結果。
+
+        Args:
+            text (str): 要翻譯的文件
+            source_lang (str): 來源語言
+            target_lang (str): 目標語言
+            batch_size (int): 每個批次的句子數
+            stats (dict | None): 傳入時填入句數、耗時與每秒句數
+
+        Returns:
+            Iterator[str]: 翻譯後的句子 (含分隔字元)
+        """
+        return document.translate_document(
+            self, text, source_lang, target_lang, batch_size, stats
+        )
+
+    def generation_settings(self) -> dict:
+        """回傳與預設值不同的生成設定，供快取鍵使用"""
+        return self.model.generation_config.to_diff_dict()
+
     def to_language_code(self, language: str) -> str:
         """
         將語言名稱轉換為語言代碼。
@@ -65,15 +217,7 @@ class MBARTTranslator:
         return self.LANG_CODES[language]
 
     def test_translations(self):
-        test_sentences = {
-            "zh": "今天天气真好。",
-            "en": "The weather is nice today.",
-            "ja": "今日の天気はとても良いです。",
-            "ko": "오늘 날씨가 정말 좋습니다.",
-            "th": "วันนี้อากาศดีจริงๆ",
-        }
-
-        for source_lang, source_text in test_sentences.items():
+        for source_lang, source_text in self.TEST_SENTENCES.items():
             print(f"\n原文 ({source_lang}): {source_text}")
             for target_lang in self.LANG_CODES.keys():
                 if source_lang != target_lang:
@@ -82,7 +226,12 @@ class MBARTTranslator:
 
 
 def main():
-    translator = MBARTTranslator()
+    parser = argparse.ArgumentParser(description="Translate the mBART test sentences.")
+    parser.add_argument(
+        "--backend", choices=translation_backend.BACKENDS, default="eager"
+    )
+    args = parser.parse_args()
+    translator = MBARTTranslator(backend=args.backend)
     translator.test_translations()
 
 
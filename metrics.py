@@ -0,0 +1,74 @@
+import math
+import re
+from collections import Counter
+
+# 中日文與泰文沒有空白分詞，以字元為單位；其他語言以詞為單位
+TOKEN_PATTERN = re.compile(
+    r"[\u0e00-\u0e7f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]|\w+|[^\w\s]"
+)
+
+
+def edit_distance(reference: list | str, hypothesis: list | str) -> int:
+    """Levenshtein 編輯距離"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_item in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_item in enumerate(hypothesis, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ref_item != hyp_item),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def cer(reference: str, hypothesis: str) -> float:
+    """字元錯誤率 (character error rate)，忽略空白"""
+    reference = re.sub(r"\s+", "", reference)
+    hypothesis = re.sub(r"\s+", "", hypothesis)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    return edit_distance(reference, hypothesis) / len(reference)
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def bleu(references: list[str], hypotheses: list[str], max_n: int = 4) -> float:
+    """
+    Corpus BLEU (0-100)，每個句子只有一個參考翻譯。
+
+    Args:
+        references (list[str]): 參考翻譯
+        hypotheses (list[str]): 待評估的翻譯
+        max_n (int): 最大 n-gram 長度
+
+    Returns:
+        float: BLEU 分數
+    """
+    matches = [0] * max_n
+    totals = [0] * max_n
+    ref_length = hyp_length = 0
+    for reference, hypothesis in zip(references, hypotheses):
+        ref_tokens, hyp_tokens = tokenize(reference), tokenize(hypothesis)
+        ref_length += len(ref_tokens)
+        hyp_length += len(hyp_tokens)
+        for n in range(1, max_n + 1):
+            ref_ngrams = Counter(
+                tuple(ref_tokens[i : i + n]) for i in range(len(ref_tokens) - n + 1)
+            )
+            hyp_ngrams = Counter(
+                tuple(hyp_tokens[i : i + n]) for i in range(len(hyp_tokens) - n + 1)
+            )
+            matches[n - 1] += sum((ref_ngrams & hyp_ngrams).values())
+            totals[n - 1] += max(len(hyp_tokens) - n + 1, 0)
+
+    if hyp_length == 0 or 0 in matches:
+        return 0.0
+    log_precision = sum(math.log(m / t) for m, t in zip(matches, totals)) / max_n
+    brevity_penalty = min(1.0, math.exp(1 - ref_length / hyp_length))
+    return 100 * brevity_penalty * math.exp(log_precision)
@@ -0,0 +1,186 @@
+"""
+集中管理已載入模型的 registry。
+
+同一個 checkpoint 只載入一次，之後的請求直接共用；常駐模型的總大小超過 RAM 預算時，
+依最久未使用 (LRU) 的順序釋放。registry 只能釋放自己的參考，呼叫端若還持有模型，
+記憶體要等呼叫端放掉參考後才會真正釋放。
+"""
+
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass, field
+
+
+def physical_memory_bytes() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def default_budget_bytes() -> int:
+    """MODEL_RAM_BUDGET_GB 環境變數，未設定時為實體記憶體的 75%"""
+    if budget := os.environ.get("MODEL_RAM_BUDGET_GB"):
+        return int(float(budget) * 1024**3)
+    return int(physical_memory_bytes() * 0.75)
+
+
+def iter_tensors(obj):
+    """列出模型 (nn.Module、transformers pipeline 或它們的 tuple/list) 的所有參數與 buffer"""
+    from torch import nn
+
+    if isinstance(obj, nn.Module):
+        yield from obj.parameters()
+        yield from obj.buffers()
+    elif isinstance(obj, (tuple, list)):
+        for item in obj:
+            yield from iter_tensors(item)
+    elif hasattr(obj, "model"):
+        yield from iter_tensors(obj.model)
+
+
+def unique_bytes(tensors) -> int:
+    """以 storage 位址去重後的總大小，共用的權重只算一次"""
+    storages = {}
+    for tensor in tensors:
+        storage = tensor.untyped_storage()
+        storages[(tensor.device, storage.data_ptr())] = storage.nbytes()
+    return sum(storages.values())
+
+
+@dataclass
+class ModelEntry:
+    key: Hashable
+    model: object
+    size_bytes: int
+    load_time: float
+    last_used: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class LoadStats:
+    loads: int = 0
+    hits: int = 0
+    evictions: int = 0
+    load_times: list[float] = field(default_factory=list)
+    size_bytes: int = 0
+
+
+class ModelRegistry:
+    """
+    模型 registry。
+
+    使用方法：
+    1. registry.get(key, loader) 取得模型，第一次呼叫時執行 loader() 載入
+    2. registry.stats() 查看載入次數、載入時間與目前常駐的模型
+    """
+
+    def __init__(self, budget_bytes: int | None = None):
+        self.budget_bytes = budget_bytes or default_budget_bytes()
+        self.entries: OrderedDict[Hashable, ModelEntry] = OrderedDict()
+        self.load_stats: dict[Hashable, LoadStats] = {}
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, loader: Callable[[], object]):
+        """
+        取得 key 對應的模型，尚未載入時呼叫 loader()。
+
+        Args:
+            key (Hashable): checkpoint 的識別，例如 ("whisper", "large-v3", "cpu", None)
+            loader (Callable): 載入並回傳模型的函式
+
+        Returns:
+            object: 已載入的模型
+        """
+        with self._lock:
+            stats = self.load_stats.setdefault(key, LoadStats())
+            if key in self.entries:
+                entry = self.entries[key]
+                entry.last_used = time.monotonic()
+                self.entries.move_to_end(key)
+                stats.hits += 1
+                return entry.model
+
+            # 曾經載入過的模型已知大小，先騰出空間再載入，避免峰值超過預算
+            self.make_room(stats.size_bytes)
+            start = time.perf_counter()
+            model = loader()
+            load_time = time.perf_counter() - start
+
+            size_bytes = unique_bytes(iter_tensors(model))
+            stats.loads += 1
+            stats.load_times.append(load_time)
+            stats.size_bytes = size_bytes
+            self.make_room(size_bytes)
+            self.entries[key] = ModelEntry(key, model, size_bytes, load_time)
+            return model
+
+    def resident_bytes(self) -> int:
+        return unique_bytes(
+            tensor
+            for entry in self.entries.values()
+            for tensor in iter_tensors(entry.model)
+        )
+
+    def make_room(self, incoming_bytes: int) -> None:
+        """依 LRU 順序釋放模型，直到加上 incoming_bytes 後不超過預算"""
+        while (
+            self.entries
+            and self.resident_bytes() + incoming_bytes > self.budget_bytes
+        ):
+            self.evict(next(iter(self.entries)))
+
+    def evict(self, key: Hashable) -> None:
+        with self._lock:
+            if self.entries.pop(key, None) is None:
+                return
+            self.load_stats[key].evictions += 1
+        gc.collect()
+        import torch
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def clear(self) -> None:
+        for key in list(self.entries):
+            self.evict(key)
+
+    def stats(self) -> dict:
+        """載入次數、載入時間與目前常駐的模型"""
+        with self._lock:
+            return {
+                "budget_mb": self.budget_bytes / 1024**2,
+                "resident_mb": self.resident_bytes() / 1024**2,
+                "resident": [str(key) for key in self.entries],
+                "models": {
+                    str(key): {
+                        "loads": stats.loads,
+                        "hits": stats.hits,
+                        "evictions": stats.evictions,
+                        "load_time_total": sum(stats.load_times),
+                        "size_mb": stats.size_bytes / 1024**2,
+                        "resident": key in self.entries,
+                    }
+                    for key, stats in self.load_stats.items()
+                },
+            }
+
+    def print_stats(self) -> None:
+        stats = self.stats()
+        print(
+            f"Model registry: {stats['resident_mb']:.0f}MB resident "
+            f"of {stats['budget_mb']:.0f}MB budget"
+        )
+        for key, model in stats["models"].items():
+            state = "resident" if model["resident"] else "evicted"
+            print(
+                f"  {key}: loads={model['loads']} hits={model['hits']} "
+                f"evictions={model['evictions']} "
+                f"load_time={model['load_time_total']:.1f}s "
+                f"size={model['size_mb']:.0f}MB {state}"
+            )
+
+
+# 整個行程共用的 registry
+registry = ModelRegistry()
@@ -0,0 +1,172 @@
+"""
+以執行緒與有界佇列串接的多階段處理管線。
+
+每個階段在自己的執行緒中執行，階段之間以有界佇列相連：第 N+1 個檔案在轉錄時，
+第 N 個檔案可以同時在翻譯。佇列滿了上游就會等待，記憶體中同時存在的項目數有上限。
+PyTorch 的運算會釋放 GIL，所以執行緒就能讓不同階段的推論重疊。
+
+結束後回報每個階段的使用率 (忙碌時間 / 總時間) 與輸入佇列的平均、最大深度：
+使用率接近 100% 的階段就是瓶頸，它前面的佇列也會一直是滿的。
+"""
+
+import queue
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+
+# 通知下游沒有更多項目的標記
+DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[object], object]
+    workers: int = 1
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    items: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    queue_samples: int = 0
+    queue_total: int = 0
+    queue_max: int = 0
+
+    def utilization(self, wall_seconds: float) -> float:
+        if not wall_seconds:
+            return 0.0
+        return self.busy_seconds / (wall_seconds * self.workers)
+
+    @property
+    def mean_queue_depth(self) -> float:
+        return self.queue_total / self.queue_samples if self.queue_samples else 0.0
+
+
+class Pipeline:
+    """
+    使用方法：
+    1. Pipeline([Stage("load", load), Stage("asr", asr), ...], queue_size=2)
+    2. results = pipeline.run(items) 依輸入順序回傳最後一個階段的輸出，失敗的項目為 None
+    3. pipeline.print_report() 查看各階段的使用率與佇列深度
+    """
+
+    def __init__(self, stages: list[Stage], queue_size: int = 2):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.stats = [StageStats(stage.name, stage.workers) for stage in stages]
+        self.wall_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, items: Iterable) -> list:
+        """
+        執行管線直到所有項目處理完畢。
+
+        某個階段發生例外時，該項目不再往下游傳遞並記錄在統計中，其餘項目繼續處理。
+
+        Returns:
+            list: 最後一個階段的輸出，依輸入順序排列；失敗的項目為 None
+        """
+        results = {}
+        remaining = [stage.workers for stage in self.stages]
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(i, results, remaining),
+                name=f"pipeline-{stage.name}",
+                daemon=True,
+            )
+            for i, stage in enumerate(self.stages)
+            for _ in range(stage.workers)
+        ]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        count = 0
+        for index, item in enumerate(items):
+            self.queues[0].put((index, item))
+            count += 1
+        for _ in range(self.stages[0].workers):
+            self.queues[0].put(DONE)
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - start
+
+        return [results.get(index) for index in range(count)]
+
+    def work(self, i: int, results: dict, remaining: list[int]) -> None:
+        stage, stats = self.stages[i], self.stats[i]
+        inbox = self.queues[i]
+        outbox = self.queues[i + 1] if i + 1 < len(self.stages) else None
+        while True:
+            entry = inbox.get()
+            depth = inbox.qsize()
+            with self._lock:
+                stats.queue_samples += 1
+                stats.queue_total += depth
+                stats.queue_max = max(stats.queue_max, depth)
+
+            if entry is DONE:
+                with self._lock:
+                    remaining[i] -= 1
+                    last_worker = remaining[i] == 0
+                # 同一階段的最後一個 worker 結束時，才通知下游的每個 worker
+                if last_worker and outbox is not None:
+                    for _ in range(self.stages[i + 1].workers):
+                        outbox.put(DONE)
+                return
+
+            index, item = entry
+            start = time.perf_counter()
+            try:
+                output = stage.fn(item)
+            except Exception as e:
+                print(f"[{stage.name}] item {index} failed: {e}", file=sys.stderr)
+                with self._lock:
+                    stats.errors += 1
+                continue
+            finally:
+                with self._lock:
+                    stats.busy_seconds += time.perf_counter() - start
+
+            with self._lock:
+                stats.items += 1
+            if outbox is None:
+                with self._lock:
+                    results[index] = output
+            else:
+                outbox.put((index, output))
+
+    def report(self) -> list[dict]:
+        return [
+            {
+                "stage": stats.name,
+                "workers": stats.workers,
+                "items": stats.items,
+                "errors": stats.errors,
+                "busy_seconds": stats.busy_seconds,
+                "utilization": stats.utilization(self.wall_seconds),
+                "mean_queue_depth": stats.mean_queue_depth,
+                "max_queue_depth": stats.queue_max,
+            }
+            for stats in self.stats
+        ]
+
+    def print_report(self) -> None:
+        print(f"Pipeline finished in {self.wall_seconds:.1f}s")
+        print(
+            f"  {'Stage':<12} {'Items':>5} {'Busy':>8} {'Util':>6} "
+            f"{'Queue avg':>9} {'max':>4}"
+        )
+        for row in self.report():
+            print(
+                f"  {row['stage']:<12} {row['items']:>5} {row['busy_seconds']:>7.1f}s "
+                f"{row['utilization']:>6.0%} {row['mean_queue_depth']:>9.1f} "
+                f"{row['max_queue_depth']:>4}"
+            )
@@ -0,0 +1,56 @@
+import torch
+from torch import nn
+
+# --quantize 可用的選項
+QUANTIZE_CHOICES = ["int8"]
+
+
+def plain_linear(module: nn.Linear) -> nn.Linear:
+    """以原本的權重建立標準 nn.Linear，讓 quantize_dynamic 能辨識"""
+    linear = nn.Linear(
+        module.in_features, module.out_features, bias=module.bias is not None
+    )
+    linear.weight = module.weight
+    linear.bias = module.bias
+    return linear
+
+
+def replace_linear_subclasses(model: nn.Module) -> None:
+    """
+    把 nn.Linear 的子類別換成 nn.Linear。
+
+    openai-whisper 使用自訂的 Linear (forward 只多了 dtype 轉換)，quantize_dynamic
+    只依型別比對，不處理子類別，所以先換成標準的 nn.Linear。
+    """
+    for name, child in model.named_children():
+        if isinstance(child, nn.Linear) and type(child) is not nn.Linear:
+            setattr(model, name, plain_linear(child))
+        else:
+            replace_linear_subclasses(child)
+
+
+def quantize_model(model: nn.Module, quantize: str | None) -> nn.Module:
+    """
+    對模型的 Linear 層做動態量化。
+
+    Args:
+        model (nn.Module): 已載入的模型，必須在 CPU 上
+        quantize (str | None): None 表示不量化，"int8" 為 qint8 動態量化
+
+    Returns:
+        nn.Module: 量化後的模型（原地修改）
+
+    Raises:
+        ValueError: 不支援的量化模式，或模型不在 CPU 上
+    """
+    if quantize is None:
+        return model
+    if quantize not in QUANTIZE_CHOICES:
+        raise ValueError(f"Unsupported quantize mode: {quantize}")
+    if next(model.parameters()).device.type != "cpu":
+        raise ValueError("Dynamic int8 quantization only runs on CPU.")
+
+    replace_linear_subclasses(model)
+    return torch.ao.quantization.quantize_dynamic(
+        model.eval(), {nn.Linear}, dtype=torch.qint8, inplace=True
+    )
@@ -0,0 +1,186 @@
+"""
+比較 fp32 與 int8 動態量化的延遲、記憶體與準確度偏移。
+
+每個 (模型, 量化模式) 在獨立的子行程中執行，記憶體數字才不會互相干擾。
+Whisper 以 int8 與 fp32 轉錄結果之間的 CER 衡量偏移，翻譯模型以 fp32 翻譯為參考計算 BLEU。
+
+uv run quantize_report.py --whisper tiny small --translators m2m100 mbart
+"""
+
+import argparse
+import glob
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import metrics
+
+
+def memory_mb() -> dict:
+    """目前與峰值的 resident memory (MB)"""
+    status = {}
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as file:
+            for line in file:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    status[key] = int(value.split()[0]) / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "rss_mb": status.get("VmRSS", peak),
+        "peak_rss_mb": status.get("VmHWM", peak),
+    }
+
+
+def run_whisper(model_size: str, quantize: str | None, files: list[str]) -> dict:
+    import asr1
+    import audio_cache
+
+    model, load_time = asr1.load_model(model_size, "cpu", quantize=quantize)
+    outputs, latencies = {}, []
+    for path in files:
+        audio = audio_cache.load_audio(path)
+        start = time.perf_counter()
+        text, _, _, _ = asr1.transcribe_audio(audio, model)
+        latencies.append(time.perf_counter() - start)
+        outputs[path] = text
+    return {"load_time": load_time, "latencies": latencies, "outputs": outputs}
+
+
+def run_translator(name: str, quantize: str | None) -> dict:
+    import fy_server
+
+    start = time.perf_counter()
+    translator = fy_server.load_translator(name, use_cache=False, quantize=quantize)
+    load_time = time.perf_counter() - start
+    outputs, latencies = {}, []
+    for source_lang, text in translator.TEST_SENTENCES.items():
+        targets = [lang for lang in translator.LANG_CODES if lang != source_lang]
+        start = time.perf_counter()
+        translations = translator.translate_many(text, source_lang, targets)
+        latencies.append(time.perf_counter() - start)
+        for target_lang, translated in translations.items():
+            outputs[f"{source_lang}->{target_lang}"] = translated
+    return {"load_time": load_time, "latencies": latencies, "outputs": outputs}
+
+
+def run_worker(args) -> None:
+    quantize = None if args.quantize == "fp32" else args.quantize
+    if args.kind == "whisper":
+        result = run_whisper(args.model, quantize, sorted(glob.glob(args.files)))
+    else:
+        result = run_translator(args.model, quantize)
+    print(json.dumps(result | memory_mb(), ensure_ascii=False))
+
+
+def spawn_worker(kind: str, model: str, quantize: str, files: str) -> dict:
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--worker",
+        kind,
+        model,
+        quantize,
+        "--files",
+        files,
+    ]
+    print(f"running {kind} {model} {quantize} ...", file=sys.stderr)
+    output = subprocess.run(command, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def compare(kind: str, model: str, files: str) -> dict:
+    fp32 = spawn_worker(kind, model, "fp32", files)
+    int8 = spawn_worker(kind, model, "int8", files)
+    keys = list(fp32["outputs"])
+    if kind == "whisper":
+        drift = {
+            "cer": statistics.mean(
+                metrics.cer(fp32["outputs"][key], int8["outputs"][key]) for key in keys
+            )
+        }
+    else:
+        drift = {
+            "bleu": metrics.bleu(
+                [fp32["outputs"][key] for key in keys],
+                [int8["outputs"][key] for key in keys],
+            )
+        }
+
+    def summary(result):
+        return {
+            "load_time": result["load_time"],
+            "latency_total": sum(result["latencies"]),
+            "latency_p50": statistics.median(result["latencies"]),
+            "rss_mb": result["rss_mb"],
+            "peak_rss_mb": result["peak_rss_mb"],
+        }
+
+    return {
+        "kind": kind,
+        "model": model,
+        "fp32": summary(fp32),
+        "int8": summary(int8),
+        "drift": drift,
+        "outputs": {"fp32": fp32["outputs"], "int8": int8["outputs"]},
+    }
+
+
+def print_report(rows: list[dict]) -> None:
+    print(
+        f"{'Model':<10} {'Latency fp32':>13} {'int8':>8} {'Speedup':>8} "
+        f"{'RSS fp32':>9} {'int8':>8} {'Drift':>14}"
+    )
+    for row in rows:
+        fp32, int8 = row["fp32"], row["int8"]
+        speedup = fp32["latency_total"] / int8["latency_total"]
+        drift = (
+            f"CER {row['drift']['cer']:.1%}"
+            if "cer" in row["drift"]
+            else f"BLEU {row['drift']['bleu']:.1f}"
+        )
+        print(
+            f"{row['model']:<10} {fp32['latency_total']:>12.1f}s "
+            f"{int8['latency_total']:>7.1f}s {speedup:>7.2f}x "
+            f"{fp32['peak_rss_mb']:>7.0f}MB {int8['peak_rss_mb']:>6.0f}MB {drift:>14}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare fp32 and dynamic int8 quantization on the test corpus."
+    )
+    parser.add_argument("--whisper", nargs="*", default=["tiny", "small"])
+    parser.add_argument(
+        "--translators",
+        nargs="*",
+        default=["m2m100", "mbart"],
+        choices=["m2m100", "mbart"],
+    )
+    parser.add_argument("--files", default="test-data/*.mp3")
+    parser.add_argument("--output", help="JSON output path.")
+    parser.add_argument("--worker", nargs=3, metavar=("KIND", "MODEL", "QUANTIZE"))
+    args = parser.parse_args()
+
+    if args.worker:
+        args.kind, args.model, args.quantize = args.worker
+        run_worker(args)
+        return
+
+    rows = [compare("whisper", size, args.files) for size in args.whisper]
+    rows += [compare("translator", name, args.files) for name in args.translators]
+    print_report(rows)
+
+    output = args.output or f"dist/quantize-{time.strftime('%Y%m%d-%H%M')}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(rows, file, ensure_ascii=False, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
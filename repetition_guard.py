@@ -0,0 +1,389 @@
+"""
+Whisper 解碼時的重複迴圈防護。
+
+雜訊或接近靜音的音訊常讓 Whisper 陷入重複迴圈，同一段 n-gram 一直輸出到 token 上限
+(n_text_ctx // 2)，model.transcribe 接著又因為 compression ratio 太高以更高的
+temperature 重跑，這些片段決定了 p99 延遲。
+
+guard 以 LogitFilter 的形式加進每個 DecodingTask，在產生 token 的同時檢查：
+- 結尾的 n-gram 連續重複，且重複的部分至少涵蓋 min_span 個 token
+- 已產生文字的 compression ratio 超過門檻 (與 model.transcribe 的 fallback 條件相同)
+觸發時強制下一個 token 為 EOT，提早結束這個片段。
+
+trim=True (預設關閉) 時再把重複的尾巴刪掉、只留一份，model.transcribe 就不會因為
+compression ratio 再以更高的 temperature 重跑。代價是被截斷的片段沒有結尾的時間戳記時，
+model.transcribe 會直接跳過整個 30 秒視窗，迴圈之後同一視窗內的語音也會被丟掉。
+
+uv run repetition_guard.py test-data/noise.mp3 --model small
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, replace
+
+import whisper
+import whisper.decoding
+from whisper.decoding import DecodingResult, LogitFilter
+from whisper.utils import compression_ratio
+
+
+@dataclass
+class GuardConfig:
+    enabled: bool = True
+    # 重複的部分至少涵蓋的 token 數：單一 token 要重複 16 次、4-gram 要重複 4 次
+    min_span: int = 16
+    # 至少重複的次數，避免長 n-gram 重複兩次就被截斷
+    min_repeats: int = 3
+    max_ngram: int = 32
+    compression_ratio_threshold: float = 2.4
+    # 文字太短時 compression ratio 不穩定，至少累積這麼多 token 才檢查
+    min_tokens: int = 48
+    check_every: int = 8
+    # 刪掉重複的尾巴，避免 temperature fallback；可能丟掉同一視窗內迴圈之後的語音
+    trim: bool = False
+
+
+@dataclass
+class CutSegment:
+    label: str
+    call: int
+    index: int
+    reason: str
+    tokens_generated: int
+    tokens_saved: int
+    seconds: float
+    text: str
+
+
+@dataclass
+class DecodeCall:
+    seconds: float
+    cut: bool
+
+
+class RepetitionFilter(LogitFilter):
+    """加在 DecodingTask.logit_filters 的最後，觸發時把該列的 logits 改成只剩 EOT"""
+
+    def __init__(self, guard: "RepetitionGuard", task):
+        self.guard = guard
+        self.tokenizer = task.tokenizer
+        self.eot = task.tokenizer.eot
+        self.sample_begin = task.sample_begin
+        self.sample_len = task.sample_len
+        self.n_group = task.n_group
+        # 音訊在 batch 中的位置 -> (原因, 已產生的 token 數)
+        self.cut: dict[int, tuple[str, int]] = {}
+
+    def apply(self, logits, tokens):
+        last_tokens = tokens[:, -1].tolist()
+        for row, last in enumerate(last_tokens):
+            if last == self.eot:
+                continue
+            generated = tokens[row, self.sample_begin :].tolist()
+            # 時間戳記 token 每次都不同，只看文字 token
+            text_tokens = [token for token in generated if token < self.eot]
+            reason = self.guard.check(text_tokens, self.tokenizer)
+            if reason is None:
+                continue
+            logits[row] = -float("inf")
+            logits[row, self.eot] = 0
+            # beam search 時同一段音訊有 n_group 列，只記錄第一次觸發
+            self.cut.setdefault(row // self.n_group, (reason, len(generated)))
+
+
+class RepetitionGuard:
+    """
+    使用方法：
+    1. with repetition_guard.active(label): model.transcribe(...) 或 whisper.decode(...)
+    2. repetition_guard.config 調整門檻，config.enabled = False 停用
+    3. repetition_guard.print_report() 查看被截斷的片段、省下的 token 數與解碼延遲
+    """
+
+    def __init__(self, config: GuardConfig | None = None):
+        self.config = config or GuardConfig()
+        self.cuts: list[CutSegment] = []
+        self.calls: list[DecodeCall] = []
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._originals = None
+        self._local = threading.local()
+
+    def repeat_tail(self, text_tokens: list[int]) -> int | None:
+        """結尾有連續重複的 n-gram 時，回傳重複多出來的 token 數 (只保留一份)"""
+        config = self.config
+        for n in range(1, config.max_ngram + 1):
+            repeats = max(config.min_repeats, -(-config.min_span // n))
+            span = n * repeats
+            if span > len(text_tokens):
+                continue
+            tail = text_tokens[-span:]
+            if tail == tail[-n:] * repeats:
+                return span - n
+        return None
+
+    def compression_due(self, length: int) -> bool:
+        config = self.config
+        return length >= config.min_tokens and length % config.check_every == 0
+
+    def check(self, text_tokens: list[int], tokenizer) -> str | None:
+        """檢查目前已產生的文字 token，需要截斷時回傳原因"""
+        if self.repeat_tail(text_tokens) is not None:
+            return "repeat"
+        if self.compression_due(len(text_tokens)):
+            text = tokenizer.decode(text_tokens)
+            if compression_ratio(text) > self.config.compression_ratio_threshold:
+                return "compression"
+        return None
+
+    def keep_length(self, text_tokens: list[int], tokenizer) -> int:
+        """
+        依與 check 相同的規則找出第一次觸發的位置，回傳應保留的文字 token 數。
+
+        重複時保留到第一份重複內容為止；compression ratio 過高時保留到上一次檢查通過的長度。
+        """
+        last_ok = 0
+        for length in range(1, len(text_tokens) + 1):
+            prefix = text_tokens[:length]
+            if (extra := self.repeat_tail(prefix)) is not None:
+                return length - extra
+            if self.compression_due(length):
+                text = tokenizer.decode(prefix)
+                if compression_ratio(text) > self.config.compression_ratio_threshold:
+                    return last_ok
+                last_ok = length
+        return len(text_tokens)
+
+    def trim(self, result: DecodingResult, tokenizer) -> DecodingResult:
+        """刪掉重複的尾巴並重新計算 text 與 compression ratio"""
+        eot = tokenizer.eot
+        text_tokens = [token for token in result.tokens if token < eot]
+        keep = self.keep_length(text_tokens, tokenizer)
+        if keep == len(text_tokens):
+            return result
+        tokens, count = [], 0
+        for token in result.tokens:
+            if token < eot:
+                if count == keep:
+                    break
+                count += 1
+            tokens.append(token)
+        text = tokenizer.decode(tokens).strip()
+        return replace(
+            result, tokens=tokens, text=text, compression_ratio=compression_ratio(text)
+        )
+
+    def finish(self, task, results: list[DecodingResult], seconds: float):
+        # 其他執行緒在 install 之前建立的 DecodingTask 沒有 repetition_filter
+        repetition_filter = getattr(task, "repetition_filter", None)
+        if repetition_filter is None:
+            return results
+        cut = repetition_filter.cut
+        label = getattr(self._local, "label", "")
+        with self._lock:
+            call = len(self.calls)
+            self.calls.append(DecodeCall(seconds, bool(cut)))
+        for index, (reason, generated) in sorted(cut.items()):
+            if index >= len(results):
+                continue
+            if self.config.trim:
+                results[index] = self.trim(results[index], task.tokenizer)
+            with self._lock:
+                self.cuts.append(
+                    CutSegment(
+                        label=label,
+                        call=call,
+                        index=index,
+                        reason=reason,
+                        tokens_generated=generated,
+                        # 沒有 guard 時迴圈會一直跑到 sample_len，這是省下的上限
+                        tokens_saved=max(task.sample_len - generated, 0),
+                        seconds=seconds,
+                        text=results[index].text,
+                    )
+                )
+        return results
+
+    def install(self):
+        task_class = whisper.decoding.DecodingTask
+        init, run = task_class.__init__, task_class.run
+        guard = self
+
+        def guarded_init(task, model, options):
+            init(task, model, options)
+            task.repetition_filter = RepetitionFilter(guard, task)
+            task.logit_filters.append(task.repetition_filter)
+
+        def guarded_run(task, mel):
+            start = time.perf_counter()
+            results = run(task, mel)
+            return guard.finish(task, results, time.perf_counter() - start)
+
+        task_class.__init__, task_class.run = guarded_init, guarded_run
+        self._originals = (init, run)
+
+    def uninstall(self):
+        task_class = whisper.decoding.DecodingTask
+        task_class.__init__, task_class.run = self._originals
+        self._originals = None
+
+    @contextmanager
+    def active(self, label: str = ""):
+        """
+        在 with 區塊內讓所有 Whisper 解碼經過 guard。
+
+        可以巢狀或在多個執行緒同時使用，最後一個離開時才還原 DecodingTask。
+        """
+        if not self.config.enabled:
+            yield
+            return
+        with self._lock:
+            if self._depth == 0:
+                self.install()
+            self._depth += 1
+        previous = getattr(self._local, "label", "")
+        self._local.label = label
+        try:
+            yield
+        finally:
+            self._local.label = previous
+            with self._lock:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.uninstall()
+
+    def cache_options(self) -> dict | None:
+        """會影響辨識結果的設定，加進 ASR 結果快取的鍵"""
+        return asdict(self.config) if self.config.enabled else None
+
+    def report(self) -> dict:
+        cut_times = [call.seconds for call in self.calls if call.cut]
+        other_times = [call.seconds for call in self.calls if not call.cut]
+        return {
+            "config": asdict(self.config),
+            "decode_calls": len(self.calls),
+            "decode_seconds": sum(call.seconds for call in self.calls),
+            "cut_calls": len(cut_times),
+            "cut_mean_seconds": sum(cut_times) / len(cut_times) if cut_times else 0,
+            "other_mean_seconds": (
+                sum(other_times) / len(other_times) if other_times else 0
+            ),
+            "tokens_saved": sum(cut.tokens_saved for cut in self.cuts),
+            "cuts": [asdict(cut) for cut in self.cuts],
+        }
+
+    def print_report(self) -> None:
+        report = self.report()
+        if not report["config"]["enabled"]:
+            print("Repetition guard: disabled")
+            return
+        print(
+            f"Repetition guard: {len(self.cuts)} segments cut in "
+            f"{report['cut_calls']}/{report['decode_calls']} decode calls, "
+            f"~{report['tokens_saved']} tokens saved"
+        )
+        print(
+            f"  decode latency: {report['cut_mean_seconds']:.2f}s mean with cuts, "
+            f"{report['other_mean_seconds']:.2f}s without "
+            f"({report['decode_seconds']:.1f}s total)"
+        )
+        for cut in self.cuts:
+            print(
+                f"  {cut.label or '-'} call={cut.call} #{cut.index} {cut.reason}: "
+                f"cut at {cut.tokens_generated} tokens, saved {cut.tokens_saved} "
+                f"({cut.seconds:.2f}s) {cut.text[:60]!r}"
+            )
+
+    def reset(self):
+        with self._lock:
+            self.cuts.clear()
+            self.calls.clear()
+
+
+# 整個行程共用的 guard
+repetition_guard = RepetitionGuard()
+
+
+def transcribe_timed(model, audio_file: str, guarded: bool, **options) -> dict:
+    from encoder_cache import encoder_cache
+
+    # 兩次都從冷快取開始，比較的只有 guard 的差別
+    encoder_cache.clear()
+    repetition_guard.config.enabled = guarded
+    start = time.perf_counter()
+    with repetition_guard.active(audio_file):
+        result = model.transcribe(audio_file, **options)
+    return {
+        "time": time.perf_counter() - start,
+        "text": result["text"],
+        "segments": len(result["segments"]),
+        "fallbacks": sum(segment["temperature"] > 0 for segment in result["segments"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare Whisper transcription with and without the repetition "
+        "guard."
+    )
+    parser.add_argument("files", nargs="+", help="Audio files to transcribe.")
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--language")
+    parser.add_argument("--min-span", type=int, default=GuardConfig.min_span)
+    parser.add_argument("--min-repeats", type=int, default=GuardConfig.min_repeats)
+    parser.add_argument(
+        "--compression-ratio-threshold",
+        type=float,
+        default=GuardConfig.compression_ratio_threshold,
+    )
+    parser.add_argument(
+        "--trim",
+        action="store_true",
+        help="Drop the repeated tail so model.transcribe does not retry the segment; "
+        "speech after the loop in the same 30 s window may be skipped.",
+    )
+    parser.add_argument("--output", help="JSON output path.")
+    args = parser.parse_args()
+
+    import asr1
+
+    repetition_guard.config = GuardConfig(
+        min_span=args.min_span,
+        min_repeats=args.min_repeats,
+        compression_ratio_threshold=args.compression_ratio_threshold,
+        trim=args.trim,
+    )
+    model, _ = asr1.load_model(args.model, args.device)
+    options = {"language": args.language} if args.language else {}
+
+    rows = []
+    print(f"{'File':<28} {'Plain':>8} {'Guarded':>8} {'Fallbacks':>9}")
+    for audio_file in args.files:
+        plain = transcribe_timed(model, audio_file, guarded=False, **options)
+        guarded = transcribe_timed(model, audio_file, guarded=True, **options)
+        rows.append({"file": audio_file, "plain": plain, "guarded": guarded})
+        print(
+            f"{os.path.basename(audio_file):<28} {plain['time']:>7.1f}s "
+            f"{guarded['time']:>7.1f}s "
+            f"{plain['fallbacks']:>4} -> {guarded['fallbacks']}"
+        )
+
+    repetition_guard.print_report()
+    output = args.output or f"dist/repetition-guard-{time.strftime('%Y%m%d-%H%M')}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(
+            {"files": rows, "guard": repetition_guard.report()},
+            file,
+            ensure_ascii=False,
+            indent=2,
+        )
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
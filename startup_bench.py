@@ -0,0 +1,187 @@
+"""
+量測 CLI 的冷啟動時間，並記錄在 dist/startup-history.jsonl 追蹤變化。
+
+每次以新的 python 行程執行 `python -X importtime fy.py --help`，取多次執行的中位數，
+並解析 -X importtime 的輸出，列出累計 import 時間最長的模組。
+fy 的參數檢查與 --help 不應該載入 torch / transformers，出現在清單中就是回歸。
+
+uv run startup_bench.py
+uv run startup_bench.py --command "fy_server.py --help" --repeat 10
+"""
+
+import argparse
+import json
+import os
+import platform
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_COMMAND = "fy.py --help"
+HISTORY_PATH = "dist/startup-history.jsonl"
+# 不應該出現在 CLI 啟動路徑上的模組
+HEAVY_MODULES = ["torch", "transformers", "whisper", "numpy", "datasets"]
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """
+    解析 -X importtime 的輸出。
+
+    每行格式為 `import time: self [us] | cumulative | imported package`，
+    套件名稱前的空白數表示巢狀層級，層級 0 是直接由程式 import 的模組。
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        rows.append(
+            {
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip())) // 2,
+                "self_us": int(fields[0]),
+                "cumulative_us": int(fields[1]),
+            }
+        )
+    return rows
+
+
+def run_once(command: list[str]) -> tuple[float, list[dict]]:
+    """
+    執行一次並計時。
+
+    Raises:
+        RuntimeError: 指令以非 0 結束 (例如 import 錯誤)，這時量到的時間沒有意義
+    """
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *command],
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        # -X importtime 的輸出也在 stderr，只顯示真正的錯誤訊息
+        errors = [
+            line
+            for line in completed.stderr.splitlines()
+            if not line.startswith("import time:")
+        ]
+        raise RuntimeError(
+            f"{shlex.join(command)} exited with {completed.returncode}:\n"
+            + "\n".join(errors[-20:])
+        )
+    return elapsed, parse_importtime(completed.stderr)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(command: str, repeat: int, top: int) -> dict:
+    args = shlex.split(command)
+    # 第一次執行只用來暖 OS 的檔案快取與 .pyc，不列入統計
+    run_once(args)
+    runs = [run_once(args) for _ in range(repeat)]
+    wall = [elapsed for elapsed, _ in runs]
+    imports = runs[-1][1]
+
+    top_level = sorted(
+        (row for row in imports if row["depth"] == 0),
+        key=lambda row: row["cumulative_us"],
+        reverse=True,
+    )
+    loaded = {row["module"].split(".")[0] for row in imports}
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "command": command,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "median_seconds": statistics.median(wall),
+        "min_seconds": min(wall),
+        "import_seconds": sum(row["cumulative_us"] for row in top_level) / 1e6,
+        "modules": len(imports),
+        "heavy_modules": [module for module in HEAVY_MODULES if module in loaded],
+        "top_imports": [
+            {"module": row["module"], "ms": row["cumulative_us"] / 1000}
+            for row in top_level[:top]
+        ],
+    }
+
+
+def load_history(path: str, command: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        entries = [json.loads(line) for line in file if line.strip()]
+    return [entry for entry in entries if entry["command"] == command]
+
+
+def print_result(result: dict, previous: dict | None):
+    print(
+        f"{result['command']}: median {result['median_seconds'] * 1000:.0f}ms "
+        f"(min {result['min_seconds'] * 1000:.0f}ms, {result['repeat']} runs), "
+        f"imports {result['import_seconds'] * 1000:.0f}ms in {result['modules']} modules"
+    )
+    if previous:
+        change = result["median_seconds"] / previous["median_seconds"] - 1
+        print(
+            f"  vs {previous['commit'] or previous['time']}: "
+            f"{previous['median_seconds'] * 1000:.0f}ms ({change:+.1%})"
+        )
+    if result["heavy_modules"]:
+        print(f"  ⚠️ heavy modules on the startup path: {result['heavy_modules']}")
+    print(f"  {'Module':<32} {'Cumulative':>10}")
+    for row in result["top_imports"]:
+        print(f"  {row['module']:<32} {row['ms']:>8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Track the cold-start time of the fy CLI with -X importtime."
+    )
+    parser.add_argument(
+        "--command",
+        default=DEFAULT_COMMAND,
+        help="Script and arguments to run with the current interpreter.",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Top imports to list.")
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument(
+        "--no-save", action="store_true", help="Do not append to the history file."
+    )
+    args = parser.parse_args()
+
+    history = load_history(args.history, args.command)
+    try:
+        result = benchmark(args.command, args.repeat, args.top)
+    except RuntimeError as e:
+        # 失敗的執行不寫入歷史紀錄
+        sys.exit(str(e))
+    print_result(result, history[-1] if history else None)
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as file:
+            file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        print(f"Appended to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
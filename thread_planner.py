@@ -0,0 +1,318 @@
+"""
+依機器與模型大小決定 torch 的執行緒數與 CPU affinity。
+
+- 從 /sys 讀取實體核心 (排除 hyper-thread 的 sibling) 與 NUMA node
+- 模型越小，多開執行緒的效益越低，依參數量決定 intra-op 執行緒數上限
+- 多個 worker 同時執行時，把實體核心切成不重疊的區塊，並盡量讓每個 worker 留在同一個 NUMA node
+- calibrate() 實測不同執行緒數，把最快的設定依機器記錄下來，之後直接沿用
+
+uv run thread_planner.py --show
+uv run thread_planner.py --calibrate whisper-large-v3 m2m100
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import socket
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from kv_cache import DEFAULT_CACHE_DIR
+
+CALIBRATION_PATH = DEFAULT_CACHE_DIR / "thread-plan.json"
+
+# (參數量上限, intra-op 執行緒數上限)；超過最後一項時使用所有分配到的核心
+THREAD_CAPS = [
+    (100_000_000, 4),  # whisper tiny / base
+    (500_000_000, 8),  # whisper small
+    (1_000_000_000, 16),  # whisper medium, mBART-50
+]
+
+
+@dataclass
+class CpuTopology:
+    # 每個實體核心的第一個邏輯 CPU，依 NUMA node 排序
+    cores: list[int]
+    # NUMA node -> 該 node 上的實體核心
+    nodes: dict[int, list[int]]
+
+
+@dataclass
+class ThreadPlan:
+    intra_op: int
+    inter_op: int
+    # 要綁定的 CPU；空 list 表示不設定 affinity
+    cpus: list[int]
+
+
+def parse_cpulist(text: str) -> list[int]:
+    """解析 "0-3,8,10-11" 格式的 CPU 清單"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def read_sys(path: str) -> str | None:
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def detect_topology() -> CpuTopology:
+    """偵測目前行程可以使用的實體核心與 NUMA node，/sys 不可用時視每個 CPU 為一個核心"""
+    # macOS 與 Windows 沒有 sched_getaffinity，視為可以使用所有 CPU
+    if hasattr(os, "sched_getaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+    node_of = {}
+    for node_path in glob.glob("/sys/devices/system/node/node[0-9]*"):
+        cpulist = read_sys(f"{node_path}/cpulist")
+        for cpu in parse_cpulist(cpulist or ""):
+            node_of[cpu] = int(node_path.rsplit("node", 1)[1])
+
+    seen = set()
+    nodes: dict[int, list[int]] = {}
+    for cpu in available:
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        core = (
+            read_sys(f"{topology}/physical_package_id"),
+            read_sys(f"{topology}/core_id"),
+        )
+        if core[1] is not None and core in seen:
+            continue
+        seen.add(core)
+        nodes.setdefault(node_of.get(cpu, 0), []).append(cpu)
+    cores = [cpu for node in sorted(nodes) for cpu in nodes[node]]
+    return CpuTopology(cores=cores, nodes=nodes)
+
+
+def thread_cap(num_parameters: int | None) -> int | None:
+    if num_parameters is None:
+        return None
+    for limit, cap in THREAD_CAPS:
+        if num_parameters < limit:
+            return cap
+    return None
+
+
+def count_parameters(model) -> int | None:
+    from model_registry import iter_tensors
+
+    tensors = list(iter_tensors(model))
+    return sum(tensor.numel() for tensor in tensors) if tensors else None
+
+
+def machine_id(topology: CpuTopology) -> str:
+    """calibration 的 key：主機名稱、CPU 型號與可用的核心數"""
+    cpu = platform.processor() or platform.machine()
+    return f"{socket.gethostname()}/{cpu}/{len(topology.cores)}"
+
+
+def load_calibration(path: Path = CALIBRATION_PATH) -> dict:
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def calibrated_threads(model_name: str, topology: CpuTopology) -> int | None:
+    entry = load_calibration().get(machine_id(topology), {}).get(model_name)
+    return entry["intra_op"] if entry else None
+
+
+def plan_threads(
+    model_name: str,
+    num_parameters: int | None = None,
+    workers: int = 1,
+    topology: CpuTopology | None = None,
+) -> list[ThreadPlan]:
+    """
+    為 workers 個同時執行的 worker 各規劃一組執行緒設定。
+
+    Args:
+        model_name (str): 模型名稱，用來查詢 calibration 結果
+        num_parameters (int | None): 模型參數量，沒有 calibration 時用來決定執行緒數上限
+        workers (int): 同時執行的 worker 數
+        topology (CpuTopology | None): 預設為 detect_topology()
+
+    Returns:
+        list[ThreadPlan]: 每個 worker 一組設定；workers > 1 時各自綁定不重疊的核心
+    """
+    topology = topology or detect_topology()
+    cores = topology.cores
+    workers = max(min(workers, len(cores)), 1)
+    per_worker = len(cores) // workers
+    intra_op = calibrated_threads(model_name, topology) or thread_cap(num_parameters)
+    intra_op = min(intra_op or per_worker, per_worker)
+
+    if workers == 1:
+        return [ThreadPlan(intra_op=intra_op, inter_op=1, cpus=[])]
+    # cores 已依 NUMA node 排序，連續切塊讓 worker 盡量不跨 node
+    return [
+        ThreadPlan(
+            intra_op=intra_op,
+            inter_op=1,
+            cpus=cores[i * per_worker : i * per_worker + intra_op],
+        )
+        for i in range(workers)
+    ]
+
+
+def apply_plan(plan: ThreadPlan) -> None:
+    import torch
+
+    torch.set_num_threads(plan.intra_op)
+    try:
+        torch.set_num_interop_threads(plan.inter_op)
+    except RuntimeError:
+        # inter-op thread pool 在第一次平行運算後就不能再調整
+        pass
+    # 沒有 sched_setaffinity 的平台只設定執行緒數
+    if plan.cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, plan.cpus)
+
+
+def configure(
+    model_name: str, model=None, worker_index: int = 0, workers: int = 1
+) -> ThreadPlan:
+    """
+    依 calibration 或模型大小設定目前行程的執行緒數與 affinity。
+
+    Args:
+        model_name (str): 模型名稱，例如 "whisper-large-v3" 或 "facebook/m2m100_1.2B"
+        model: 已載入的模型，用來計算參數量
+        worker_index (int): 目前 worker 的編號
+        workers (int): 同時執行的 worker 數
+
+    Returns:
+        ThreadPlan: 套用的設定
+    """
+    plans = plan_threads(model_name, count_parameters(model), workers)
+    plan = plans[worker_index % len(plans)]
+    apply_plan(plan)
+    return plan
+
+
+def calibrate(
+    model_name: str,
+    workload: Callable[[], object],
+    repeat: int = 3,
+    path: Path = CALIBRATION_PATH,
+) -> dict:
+    """
+    以 1, 2, 4, ... 個執行緒執行 workload，記錄最快的執行緒數。
+
+    Returns:
+        dict: 最佳設定與每個執行緒數的中位延遲
+    """
+    import torch
+
+    topology = detect_topology()
+    candidates = []
+    threads = 1
+    while threads < len(topology.cores):
+        candidates.append(threads)
+        threads *= 2
+    candidates.append(len(topology.cores))
+
+    workload()  # warmup
+    timings = {}
+    for threads in candidates:
+        torch.set_num_threads(threads)
+        elapsed = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            workload()
+            elapsed.append(time.perf_counter() - start)
+        timings[threads] = sorted(elapsed)[len(elapsed) // 2]
+        print(f"  {model_name}: {threads:>3} threads {timings[threads]:.3f}s")
+
+    best = min(timings, key=timings.get)
+    entry = {
+        "intra_op": best,
+        "inter_op": 1,
+        "timings": {str(threads): t for threads, t in timings.items()},
+        "calibrated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    calibration = load_calibration(path)
+    calibration.setdefault(machine_id(topology), {})[model_name] = entry
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(calibration, file, indent=2)
+    return entry
+
+
+def whisper_workload(model_size: str) -> Callable[[], object]:
+    """一個 30 秒 window 的 encoder 前向計算"""
+    import torch
+
+    import asr1
+
+    model, _ = asr1.load_model(model_size, "cpu")
+    mel = torch.zeros(1, model.dims.n_mels, 3000)
+
+    def run():
+        with torch.no_grad():
+            model.embed_audio(mel)
+
+    return run
+
+
+def translator_workload(translator) -> Callable[[], object]:
+    """翻譯 TEST_SENTENCES 中的每個句子到英文"""
+
+    def run():
+        for source_lang, text in translator.TEST_SENTENCES.items():
+            target_lang = "ja" if source_lang == "en" else "en"
+            translator.translate(text, source_lang, target_lang)
+
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan and calibrate torch threads.")
+    parser.add_argument(
+        "--calibrate",
+        nargs="*",
+        metavar="MODEL",
+        help="Models to calibrate: whisper-<size>, m2m100 or mbart.",
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--show", action="store_true")
+    args = parser.parse_args()
+
+    topology = detect_topology()
+    print(
+        f"{len(topology.cores)} physical cores on {len(topology.nodes)} NUMA node(s), "
+        f"machine {machine_id(topology)}"
+    )
+    for name in args.calibrate or []:
+        if name.startswith("whisper-"):
+            entry = calibrate(name, whisper_workload(name.removeprefix("whisper-")))
+        else:
+            import fy_server
+
+            translator = fy_server.load_translator(name, use_cache=False)
+            entry = calibrate(translator.MODEL_NAME, translator_workload(translator))
+        print(f"{name}: best {entry['intra_op']} threads")
+
+    if args.show or not args.calibrate:
+        print(json.dumps(load_calibration(), indent=2))
+        for plan in plan_threads("", workers=args.workers, topology=topology):
+            print(asdict(plan))
+
+
+if __name__ == "__main__":
+    main()
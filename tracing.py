@@ -0,0 +1,244 @@
+"""
+各階段的輕量 tracing，輸出 Chrome trace (Perfetto) JSON 與彙總表。
+
+音檔解碼 (ffmpeg)、log-mel、encoder、decoder 每一步、tokenize / detokenize 都以 span
+記錄開始與結束時間，所有引擎 (asr1、whisper_v3、m4t_pipeline、翻譯器) 共用同一個 tracer。
+
+停用時 (預設) tracer.span() 直接回傳一個什麼都不做的共用物件，包裝過的 forward 也只多一次
+屬性檢查，所以 instrumentation 可以一直留在程式中。
+
+- 環境變數 TRACE=1 或各 CLI 的 --trace PATH 啟用
+- tracer.context("whisper-small") 為之後的 span 標上目前的引擎/模型，彙總表依此分組
+- tracer.export(path) 寫出 Chrome trace，可在 chrome://tracing 或 https://ui.perfetto.dev 開啟
+- tracer.print_summary() 印出每個階段的次數、總耗時與延遲分佈
+"""
+
+import functools
+import importlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class NullSpan:
+    """停用時共用的 span，不記錄任何東西"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(
+            self.name, self.category, self.start, time.perf_counter_ns(), self.args
+        )
+        return False
+
+
+class Tracer:
+    """
+    使用方法：
+    1. tracer.enable() 或設定 TRACE=1
+    2. with tracer.span("whisper.mel", "whisper"): ...
+    3. tracer.instrument(module, "forward", "whisper.decoder", "whisper") 包裝既有的函式
+    4. tracer.export("dist/trace.json") 與 tracer.print_summary()
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.events: list[dict] = []
+        self.label = ""
+        self.thread_names: dict[int, str] = {}
+        self.origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def span(self, name: str, category: str = "app", **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    @contextmanager
+    def context(self, label: str):
+        """
+        之後的 span 都標上 label (例如 "whisper-small")。
+
+        label 是整個行程共用的，管線的 worker 執行緒也會帶上；同一時間只應有一個 context。
+        """
+        previous, self.label = self.label, label
+        try:
+            yield
+        finally:
+            self.label = previous
+
+    def record(self, name: str, category: str, start: int, end: int, args: dict):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": {"label": self.label, **args} if self.label else args,
+        }
+        with self._lock:
+            self.events.append(event)
+            self.thread_names.setdefault(thread.ident, thread.name)
+
+    def wrap(self, fn, name: str, category: str):
+        """回傳包裝後的函式，啟用時每次呼叫記錄一個 span"""
+
+        @functools.wraps(fn)
+        def traced(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            with Span(self, name, category, {}):
+                return fn(*args, **kwargs)
+
+        traced.__wrapped_by_tracer__ = True
+        return traced
+
+    def instrument(self, owner, attribute: str, name: str, category: str):
+        """以 wrap 取代 owner.attribute；重複呼叫不會包裝兩次"""
+        fn = getattr(owner, attribute)
+        if not getattr(fn, "__wrapped_by_tracer__", False):
+            setattr(owner, attribute, self.wrap(fn, name, category))
+
+    def chrome_trace(self) -> dict:
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in thread_names.items()
+        ]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def export(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.chrome_trace(), file, ensure_ascii=False)
+        print(f"Wrote trace {path} ({len(self.events)} spans)")
+
+    def summary(self) -> list[dict]:
+        """依 (label, category, name) 彙總 span 的次數、總耗時與延遲分佈 (毫秒)"""
+        groups = defaultdict(list)
+        with self._lock:
+            for event in self.events:
+                key = (event["args"].get("label", ""), event["cat"], event["name"])
+                groups[key].append(event["dur"] / 1000)
+
+        rows = []
+        for (label, category, name), durations in groups.items():
+            durations.sort()
+            rows.append(
+                {
+                    "label": label,
+                    "category": category,
+                    "name": name,
+                    "count": len(durations),
+                    "total_ms": sum(durations),
+                    "mean_ms": sum(durations) / len(durations),
+                    "p50_ms": durations[len(durations) // 2],
+                    "p95_ms": durations[
+                        min(int(len(durations) * 0.95), len(durations) - 1)
+                    ],
+                    "max_ms": durations[-1],
+                }
+            )
+        return sorted(rows, key=lambda row: (row["label"], -row["total_ms"]))
+
+    def print_summary(self) -> None:
+        rows = self.summary()
+        if not rows:
+            return
+        print(
+            f"{'Label':<20} {'Span':<26} {'Count':>6} {'Total ms':>10} "
+            f"{'Mean':>8} {'p50':>8} {'p95':>8}"
+        )
+        for row in rows:
+            print(
+                f"{row['label'] or '-':<20} {row['name']:<26} {row['count']:>6} "
+                f"{row['total_ms']:>10.1f} {row['mean_ms']:>8.2f} "
+                f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}"
+            )
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.thread_names.clear()
+
+
+# 整個行程共用的 tracer
+tracer = Tracer(enabled=os.environ.get("TRACE", "") not in ("", "0"))
+
+
+def instrument_whisper(model):
+    """
+    為 openai-whisper 模型的 encoder、decoder 每一步與 tokenizer 加上 span。
+
+    要在 encoder_cache.install 之前呼叫，encoder span 才只包含真正執行 encoder 的時間。
+    """
+    tracer.instrument(model.encoder, "forward", "whisper.encoder", "whisper")
+    tracer.instrument(model.decoder, "forward", "whisper.decoder_step", "whisper")
+    tokenizer = importlib.import_module("whisper.tokenizer").Tokenizer
+    tracer.instrument(tokenizer, "encode", "whisper.tokenize", "whisper")
+    tracer.instrument(tokenizer, "decode", "whisper.detokenize", "whisper")
+    return model
+
+
+def instrument_seq2seq(model, prefix: str, tokenizer=None):
+    """
+    為 Hugging Face 模型的 generate、encoder、decoder 每一步與 detokenize 加上 span。
+
+    SeamlessM4T 有多個 encoder/decoder，存在的子模組都會包裝。tokenize 在呼叫端以
+    tracer.span 記錄，因為 tokenizer 的 __call__ 不能在實例上替換。
+    """
+    tracer.instrument(model, "generate", f"{prefix}.generate", prefix)
+    if tokenizer is not None:
+        tracer.instrument(tokenizer, "batch_decode", f"{prefix}.detokenize", prefix)
+    for attribute in ["speech_encoder", "text_encoder", "text_decoder"]:
+        if (module := getattr(model, attribute, None)) is not None:
+            tracer.instrument(module, "forward", f"{prefix}.{attribute}", prefix)
+    if hasattr(model, "get_encoder") and not hasattr(model, "text_encoder"):
+        tracer.instrument(model.get_encoder(), "forward", f"{prefix}.encoder", prefix)
+    # onnxruntime 後端只有 encoder 可以取得，decoder 的每一步在 generate 中
+    if hasattr(model, "get_decoder") and not hasattr(model, "text_decoder"):
+        tracer.instrument(
+            model.get_decoder(), "forward", f"{prefix}.decoder_step", prefix
+        )
+    return model
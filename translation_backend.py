@@ -0,0 +1,278 @@
+"""
+M2M100Translator / MBARTTranslator 的推論後端。
+
+- eager: 一般的 PyTorch 模型 (預設)
+- compile: encoder 與 forward (decoder 的每一步) 以 torch.compile 編譯，輸入長度會變，
+  使用 dynamic shape；第一次翻譯時會花時間編譯
+- onnx: 以 optimum 把 encoder、decoder 與含 KV cache 的 decoder 匯出成 ONNX，
+  以 onnxruntime 執行；匯出一次後存在 ~/.cache 的 onnx 目錄，之後直接載入
+
+三種後端的 greedy/beam search 輸出應該相同，`--backends` 會以 eager 的結果為基準，
+檢查 TEST_SENTENCES 所有語言組合的翻譯是否一致，並比較延遲與吞吐量。
+
+uv run translation_backend.py --model m2m100 --export
+uv run translation_backend.py --model mbart --backends eager compile onnx
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+import thread_planner
+from kv_cache import DEFAULT_CACHE_DIR
+from quantize import quantize_model
+
+BACKENDS = ["eager", "compile", "onnx"]
+ONNX_CACHE_DIR = DEFAULT_CACHE_DIR / "onnx"
+
+
+def onnx_model_class():
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError(
+            "The onnx backend needs optimum with onnxruntime: "
+            "uv add 'optimum[onnxruntime]'"
+        ) from e
+    return ORTModelForSeq2SeqLM
+
+
+def onnx_export_dir(model_name: str, revision: str) -> Path:
+    return ONNX_CACHE_DIR / f"{model_name.replace('/', '--')}-{revision}"
+
+
+def export_onnx(model_name: str, revision: str, refresh: bool = False) -> Path:
+    """
+    把模型匯出成 ONNX (encoder、decoder、含 KV cache 的 decoder)，已匯出時直接回傳目錄。
+
+    Args:
+        model_name (str): Hugging Face 模型名稱
+        revision (str): 模型版本
+        refresh (bool): 忽略已匯出的檔案重新匯出
+
+    Returns:
+        Path: 匯出的目錄
+    """
+    path = onnx_export_dir(model_name, revision)
+    if refresh or not (path / "config.json").exists():
+        print(f"Exporting {model_name}@{revision} to ONNX...", file=sys.stderr)
+        model = onnx_model_class().from_pretrained(
+            model_name, revision=revision, export=True, use_cache=True
+        )
+        # 先寫到暫存目錄再改名，並行的行程不會讀到匯出到一半的檔案
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        model.save_pretrained(tmp_path)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    return path
+
+
+def compile_model(model):
+    """以 torch.compile 編譯 encoder 與 forward；generate 每一步都會呼叫 forward"""
+    encoder = model.get_encoder()
+    encoder.forward = torch.compile(encoder.forward, dynamic=True)
+    model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def load_model(
+    model_class,
+    model_name: str,
+    revision: str,
+    backend: str = "eager",
+    quantize: str | None = None,
+):
+    """
+    以指定的後端載入 seq2seq 翻譯模型。
+
+    Args:
+        model_class: eager / compile 使用的 transformers 模型類別
+        model_name (str): Hugging Face 模型名稱
+        revision (str): 模型版本
+        backend (str): "eager"、"compile" 或 "onnx"
+        quantize (str | None): "int8" 時對 Linear 層做動態量化，onnx 後端不支援
+
+    Returns:
+        可呼叫 generate 的模型 (PreTrainedModel 或 ORTModelForSeq2SeqLM)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend} (choose from {BACKENDS})")
+
+    if backend == "onnx":
+        if quantize:
+            raise ValueError("--quantize applies to the eager and compile backends")
+        # 先檢查 optimum，沒有安裝時顯示安裝方式，而不是 onnxruntime 的 ModuleNotFoundError
+        model_type = onnx_model_class()
+        import onnxruntime
+
+        # onnxruntime 有自己的執行緒池，依 thread_planner 的設定決定執行緒數
+        plan = thread_planner.configure(model_name)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = plan.intra_op
+        options.inter_op_num_threads = plan.inter_op
+        return model_type.from_pretrained(
+            export_onnx(model_name, revision), session_options=options, use_cache=True
+        )
+
+    model = model_class.from_pretrained(model_name, revision=revision).eval()
+    model = quantize_model(model, quantize)
+    if backend == "compile":
+        model = compile_model(model)
+    return model
+
+
+def translator_class(model: str):
+    if model == "m2m100":
+        from m2m100 import M2M100Translator
+
+        return M2M100Translator
+    if model == "mbart":
+        from mbart import MBARTTranslator
+
+        return MBARTTranslator
+    raise ValueError(f"Unknown model: {model}")
+
+
+def language_pairs(translator) -> list[tuple[str, str, str]]:
+    """TEST_SENTENCES 的所有 (原文, 來源語言, 目標語言) 組合，與 test_translations 相同"""
+    return [
+        (text, source_lang, target_lang)
+        for source_lang, text in translator.TEST_SENTENCES.items()
+        for target_lang in translator.LANG_CODES
+        if source_lang != target_lang
+    ]
+
+
+def run_backend(translator, repeat: int) -> dict:
+    """
+    量測單一後端。
+
+    - translate: 每個語言組合逐一翻譯，統計每句的延遲
+    - translate_many: 每個原文一次翻成其他四種語言 (fy 的路徑)，統計每秒翻譯數
+    第一輪不計時 (torch.compile 在這時編譯，onnxruntime 在這時配置記憶體)。
+    """
+    pairs = language_pairs(translator)
+    sources = list(translator.TEST_SENTENCES.items())
+    targets = {
+        source_lang: [lang for lang in translator.LANG_CODES if lang != source_lang]
+        for source_lang, _ in sources
+    }
+
+    start = time.perf_counter()
+    outputs = [translator.translate(*pair) for pair in pairs]
+    many_outputs = {
+        source_lang: translator.translate_many(text, source_lang, targets[source_lang])
+        for source_lang, text in sources
+    }
+    warmup = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeat):
+        for pair in pairs:
+            start = time.perf_counter()
+            translator.translate(*pair)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for source_lang, text in sources:
+            translator.translate_many(text, source_lang, targets[source_lang])
+    many_seconds = time.perf_counter() - start
+
+    return {
+        "warmup_seconds": warmup,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "translations_per_second": len(pairs) * repeat / many_seconds,
+        "outputs": {
+            f"{source_lang}->{target_lang}": output
+            for (_, source_lang, target_lang), output in zip(pairs, outputs)
+        },
+        "many_outputs": {
+            f"{source_lang}->{target_lang}": output
+            for source_lang, translations in many_outputs.items()
+            for target_lang, output in translations.items()
+        },
+    }
+
+
+def mismatches(result: dict, reference: dict) -> list[str]:
+    """與 eager 的翻譯不同的語言組合"""
+    return [
+        f"{kind}:{pair}"
+        for kind in ["outputs", "many_outputs"]
+        for pair, output in reference[kind].items()
+        if result[kind].get(pair) != output
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare eager, torch.compile and onnxruntime translator backends."
+    )
+    parser.add_argument("--model", required=True, choices=["m2m100", "mbart"])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="Export the model to ONNX (once) and exit.",
+    )
+    parser.add_argument(
+        "--refresh", action="store_true", help="Re-export even if cached."
+    )
+    parser.add_argument("--output", help="JSON output path.")
+    args = parser.parse_args()
+
+    translator_type = translator_class(args.model)
+    if args.export:
+        path = export_onnx(
+            translator_type.MODEL_NAME, translator_type.MODEL_REVISION, args.refresh
+        )
+        print(f"ONNX model at {path}")
+        return
+
+    # eager 是比對的基準，一定要跑
+    backends = ["eager"] + [backend for backend in args.backends if backend != "eager"]
+    rows = []
+    reference = None
+    print(f"{'Backend':<8} {'Warmup':>8} {'p50':>9} {'Mean':>9} {'Trans/s':>8} Match")
+    for backend in backends:
+        translator = translator_type(backend=backend)
+        result = run_backend(translator, args.repeat)
+        del translator
+        reference = reference or result
+        result["backend"] = backend
+        result["mismatches"] = mismatches(result, reference)
+        rows.append(result)
+        print(
+            f"{backend:<8} {result['warmup_seconds']:>7.1f}s "
+            f"{result['p50_ms']:>7.1f}ms {result['mean_ms']:>7.1f}ms "
+            f"{result['translations_per_second']:>8.1f} "
+            f"{'ok' if not result['mismatches'] else len(result['mismatches'])}"
+        )
+        for mismatch in result["mismatches"]:
+            kind, pair = mismatch.split(":")
+            print(f"  {pair}: {result[kind][pair]!r} != {reference[kind][pair]!r}")
+
+    output = (
+        args.output
+        or f"dist/translation-backends-{args.model}-{time.strftime('%Y%m%d-%H%M')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(rows, file, ensure_ascii=False, indent=2)
+    print(f"Wrote {output}")
+    if any(row["mismatches"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import re
+import unicodedata
+from collections.abc import Iterator
+
+import document
+from kv_cache import DEFAULT_CACHE_DIR, SqliteLRUCache, make_key
+
+DEFAULT_CACHE_PATH = DEFAULT_CACHE_DIR / "translations.sqlite3"
+
+
+def normalize_text(text: str) -> str:
+    """NFKC 正規化並合併空白，讓只差在全半形或空白的輸入共用同一筆快取"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class CachedTranslator:
+    """
+    為 M2M100Translator / MBARTTranslator 加上持久化翻譯快取的包裝。
+
+    快取鍵包含模型名稱、模型版本、量化模式、推論後端、來源與目標語言代碼、生成設定
+    以及正規化後的文本，任何一項改變都不會誤用舊的翻譯結果。
+
+    使用方法：
+    1. CachedTranslator(M2M100Translator()) 包裝既有的翻譯器
+    2. 與原翻譯器相同地呼叫 translate / translate_many / translate_batch /
+       translate_document
+    3. enabled=False 時略過快取，直接呼叫模型
+    """
+
+    def __init__(
+        self,
+        translator,
+        cache: SqliteLRUCache | None = None,
+        enabled: bool = True,
+    ):
+        self.translator = translator
+        self.enabled = enabled
+        self.cache = cache or (SqliteLRUCache(DEFAULT_CACHE_PATH) if enabled else None)
+
+    def __getattr__(self, name):
+        # LANG_CODES、to_language_code 等其餘屬性直接轉給原翻譯器
+        return getattr(self.translator, name)
+
+    def cache_key(self, text: str, source_lang: str, target_lang: str) -> str:
+        return make_key(
+            self.translator.MODEL_NAME,
+            self.translator.MODEL_REVISION,
+            self.translator.quantize,
+            self.translator.backend,
+            self.translator.to_language_code(source_lang),
+            self.translator.to_language_code(target_lang),
+            self.translator.generation_settings(),
+            normalize_text(text),
+        )
+
+    def translate(self, text: str, source_lang: str, target_lang: str) -> str:
+        return self.translate_many(text, source_lang, [target_lang])[target_lang]
+
+    def translate_many(
+        self, text: str, source_lang: str, target_langs: list[str]
+    ) -> dict[str, str]:
+        """只對快取未命中的目標語言呼叫模型，其餘直接由快取取得"""
+        if not self.enabled:
+            return self.translator.translate_many(text, source_lang, target_langs)
+
+        keys = {
+            target_lang: self.cache_key(text, source_lang, target_lang)
+            for target_lang in target_langs
+        }
+        translations = {}
+        for target_lang, key in keys.items():
+            cached = self.cache.get(key)
+            if cached is not None:
+                translations[target_lang] = cached
+
+        missing = [lang for lang in target_langs if lang not in translations]
+        if missing:
+            fresh = self.translator.translate_many(text, source_lang, missing)
+            for target_lang, translated in fresh.items():
+                self.cache.put(keys[target_lang], translated)
+            translations.update(fresh)
+
+        return {lang: translations[lang] for lang in target_langs}
+
+    def translate_batch(
+        self, texts: list[str], source_lang: str, target_lang: str
+    ) -> list[str]:
+        """只把快取未命中的文本組成批次交給模型"""
+        if not self.enabled:
+            return self.translator.translate_batch(texts, source_lang, target_lang)
+
+        keys = [self.cache_key(text, source_lang, target_lang) for text in texts]
+        translations = [self.cache.get(key) for key in keys]
+        missing = [i for i, translated in enumerate(translations) if translated is None]
+        if missing:
+            fresh = self.translator.translate_batch(
+                [texts[i] for i in missing], source_lang, target_lang
+            )
+            for i, translated in zip(missing, fresh):
+                self.cache.put(keys[i], translated)
+                translations[i] = translated
+        return translations
+
+    def translate_document(
+        self,
+        text: str,
+        source_lang: str,
+        target_lang: str,
+        batch_size: int = 16,
+        stats: dict | None = None,
+    ) -> Iterator[str]:
+        """逐句快取的文件翻譯，批次經過 translate_batch 所以只翻譯未命中的句子"""
+        return document.translate_document(
+            self, text, source_lang, target_lang, batch_size, stats
+        )
+
+    def stats(self) -> dict:
+        return self.cache.stats() if self.cache else {}
@@ -0,0 +1,343 @@
+"""
+以 asyncio 實作的本機 HTTP 翻譯服務，會把同時間進來的請求動態組成批次。
+
+請求依 (來源語言, 目標語言, 長度 bucket) 分組，等待最多 max_wait_ms 或湊滿 max_batch_size
+後，整組以一次 translate_batch 翻譯，再把結果分別回給各個請求。模型在單一執行緒中依序執行，
+等待中的請求超過 max_queue 時直接回應 503，讓呼叫端稍後重試。
+
+- POST /translate  {"text": "...", "source_lang": "zh", "target_lang": "en"}
+- GET  /metrics    延遲、吞吐量、批次大小與佇列深度
+- GET  /health
+
+uv run translation_service.py --model m2m100 --port 8765
+curl -d '{"text": "今天天气真好。", "source_lang": "zh", "target_lang": "en"}' \\
+    localhost:8765/translate
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import fy_server
+
+# 回應狀態碼對應的說明文字
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+MAX_BODY_BYTES = 1024 * 1024
+# 計算延遲百分位數時保留的最近請求數
+LATENCY_WINDOW = 10_000
+
+
+class Overloaded(Exception):
+    """等待中的請求已達上限"""
+
+
+@dataclass
+class PendingRequest:
+    text: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+def length_bucket(text: str) -> int:
+    """以 2 的次方為界的長度分組，同一批次的 padding 不會超過一倍"""
+    return len(text).bit_length()
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class MicroBatcher:
+    """
+    把個別的翻譯請求組成批次。
+
+    使用方法：
+    1. 在 event loop 中啟動 run()
+    2. 每個請求 await submit(text, source_lang, target_lang)
+    """
+
+    def __init__(
+        self,
+        translator,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        max_queue: int = 256,
+    ):
+        self.translator = translator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.groups: dict[tuple, list[PendingRequest]] = {}
+        self.pending = 0
+        self.wakeup = asyncio.Event()
+        # 模型推論不保證執行緒安全，所有批次都在同一個執行緒中依序執行
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        self.started_at = time.monotonic()
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.batches = 0
+        self.batch_sizes: deque[int] = deque(maxlen=LATENCY_WINDOW)
+        self.batch_times: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    async def submit(self, text: str, source_lang: str, target_lang: str) -> str:
+        """
+        Raises:
+            Overloaded: 等待中的請求已達 max_queue
+        """
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{self.pending} requests pending")
+        request = PendingRequest(text, asyncio.get_running_loop().create_future())
+        key = (source_lang, target_lang, length_bucket(text))
+        self.groups.setdefault(key, []).append(request)
+        self.pending += 1
+        self.wakeup.set()
+        return await request.future
+
+    def next_group(self) -> tuple:
+        """已湊滿的組優先，否則選最早進來的請求所在的組"""
+        for key, requests in self.groups.items():
+            if len(requests) >= self.max_batch_size:
+                return key
+        return min(self.groups, key=lambda key: self.groups[key][0].enqueued_at)
+
+    async def run(self) -> None:
+        while True:
+            if not self.groups:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            key = self.next_group()
+            requests = self.groups[key]
+            wait = requests[0].enqueued_at + self.max_wait - time.monotonic()
+            if len(requests) < self.max_batch_size and wait > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = requests[: self.max_batch_size]
+            if len(requests) > self.max_batch_size:
+                self.groups[key] = requests[self.max_batch_size :]
+            else:
+                del self.groups[key]
+            await self.execute(key, batch)
+
+    async def execute(self, key: tuple, batch: list[PendingRequest]) -> None:
+        source_lang, target_lang, _ = key
+        start = time.monotonic()
+        try:
+            translations = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                self.translator.translate_batch,
+                [request.text for request in batch],
+                source_lang,
+                target_lang,
+            )
+        except Exception as e:
+            self.failed += len(batch)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        else:
+            finished = time.monotonic()
+            self.completed += len(batch)
+            for request, translated in zip(batch, translations):
+                self.latencies.append(finished - request.enqueued_at)
+                if not request.future.done():
+                    request.future.set_result(translated)
+        finally:
+            self.pending -= len(batch)
+            self.batches += 1
+            self.batch_sizes.append(len(batch))
+            self.batch_times.append(time.monotonic() - start)
+
+    def metrics(self) -> dict:
+        uptime = time.monotonic() - self.started_at
+        latencies = list(self.latencies)
+        return {
+            "uptime": uptime,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "pending": self.pending,
+            "batches": self.batches,
+            "throughput": self.completed / uptime if uptime else 0.0,
+            "batch_size_mean": (
+                sum(self.batch_sizes) / len(self.batch_sizes)
+                if self.batch_sizes
+                else 0.0
+            ),
+            "batch_time_p50": percentile(list(self.batch_times), 0.5),
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95),
+            "latency_p99": percentile(latencies, 0.99),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_queue": self.max_queue,
+        }
+
+
+class TranslationService:
+    """
+    HTTP/1.1 前端，支援 keep-alive。
+
+    使用方法：
+    1. TranslationService(MicroBatcher(translator))
+    2. await service.serve(host, port)
+    """
+
+    def __init__(self, batcher: MicroBatcher):
+        self.batcher = batcher
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        batcher = asyncio.create_task(self.batcher.run())
+        print(f"translation service listening on http://{host}:{port}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {"error": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close" and (
+                    version.strip() == "HTTP/1.1"
+                )
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/metrics":
+            return 200, self.batcher.metrics()
+        if method != "POST" or path != "/translate":
+            return 404, {"error": f"{method} {path} not found"}
+
+        try:
+            request = json.loads(body)
+            text = request["text"]
+            source_lang = request["source_lang"]
+            target_lang = request["target_lang"]
+            self.batcher.translator.to_language_code(source_lang)
+            self.batcher.translator.to_language_code(target_lang)
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            return 400, {"error": f"{type(e).__name__}: {e}"}
+
+        try:
+            translation = await self.batcher.submit(text, source_lang, target_lang)
+        except Overloaded as e:
+            return 503, {"error": f"overloaded: {e}"}
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        return 200, {"translation": translation}
+
+    async def respond(
+        self, writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool
+    ) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        headers = [
+            f"HTTP/1.1 {status} {REASONS[status]}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local HTTP translation service with dynamic micro-batching."
+    )
+    parser.add_argument("--model", default="m2m100", choices=["m2m100", "mbart"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=10.0,
+        help="How long to hold a request while waiting for a fuller batch.",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=256,
+        help="Pending requests beyond this are rejected with 503.",
+    )
+    parser.add_argument("--quantize", choices=fy_server.QUANTIZE_CHOICES)
+    parser.add_argument(
+        "--backend", choices=fy_server.BACKEND_CHOICES, default="eager"
+    )
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    translator = fy_server.load_translator(
+        args.model,
+        use_cache=not args.no_cache,
+        quantize=args.quantize,
+        backend=args.backend,
+    )
+    batcher = MicroBatcher(
+        translator,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue,
+    )
+    try:
+        asyncio.run(TranslationService(batcher).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+以能量為基礎的輕量語音活動偵測 (VAD)。
+
+在送進 Whisper / M4T 之前找出有語音的區段，把靜音剔除後再串接成較短的音訊，
+減少 encoder 花在靜音上的運算，也避免模型在靜音上產生幻覺文字。
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from audio_cache import SAMPLE_RATE
+
+FRAME_SECONDS = 0.03
+
+
+@dataclass
+class SpeechRegion:
+    start: float
+    end: float
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class VadResult:
+    regions: list[SpeechRegion]
+    total_seconds: float
+
+    @property
+    def speech_seconds(self) -> float:
+        return sum(region.duration for region in self.regions)
+
+    @property
+    def skipped_seconds(self) -> float:
+        return self.total_seconds - self.speech_seconds
+
+    def compact(self, audio: np.ndarray) -> np.ndarray:
+        """只保留語音區段並串接成一段音訊"""
+        if not self.regions:
+            return np.zeros(0, np.float32)
+        return np.concatenate(
+            [
+                audio[int(region.start * SAMPLE_RATE) : int(region.end * SAMPLE_RATE)]
+                for region in self.regions
+            ]
+        )
+
+    def to_original(self, seconds: float) -> float:
+        """將串接後音訊上的時間換算回原始音訊的時間"""
+        for region in self.regions:
+            if seconds <= region.duration:
+                return region.start + seconds
+            seconds -= region.duration
+        return self.regions[-1].end if self.regions else seconds
+
+    def restore_timestamps(self, segments: list[dict]) -> list[dict]:
+        """將 Whisper segments 的 start/end 換算回原始音訊的時間"""
+        return [
+            {
+                **segment,
+                "start": self.to_original(segment["start"]),
+                "end": self.to_original(segment["end"]),
+            }
+            for segment in segments
+        ]
+
+    def report(self, elapsed: float) -> str:
+        """
+        產生略過秒數與節省時間的摘要。
+
+        節省的時間以處理語音所花的時間按比例估算，假設推論時間與音訊長度成正比。
+        """
+        ratio = self.skipped_seconds / self.total_seconds if self.total_seconds else 0
+        saved = elapsed * self.skipped_seconds / self.speech_seconds if self.regions else 0
+        return (
+            f"VAD: kept {self.speech_seconds:.1f}s of {self.total_seconds:.1f}s "
+            f"in {len(self.regions)} regions, skipped {self.skipped_seconds:.1f}s "
+            f"({ratio:.0%}), est. saved {saved:.1f}s"
+        )
+
+
+def detect_speech(
+    audio: np.ndarray,
+    margin_db: float = 10.0,
+    dynamic_range_db: float = 45.0,
+    min_speech: float = 0.25,
+    min_silence: float = 0.5,
+    padding: float = 0.2,
+) -> VadResult:
+    """
+    找出音訊中的語音區段。
+
+    每個 30 ms 音框計算 RMS 能量 (dB)，高於「噪音底 + margin_db」且不低於
+    「最大能量 - dynamic_range_db」的音框視為語音，再合併短暫停頓、剔除過短區段並前後補邊。
+
+    Args:
+        audio (np.ndarray): 16 kHz 單聲道 float32 音訊
+        margin_db (float): 高於噪音底多少 dB 才算語音
+        dynamic_range_db (float): 低於最大能量多少 dB 以內才算語音
+        min_speech (float): 短於此秒數的語音區段會被丟棄
+        min_silence (float): 短於此秒數的靜音會被併入前後語音
+        padding (float): 每個語音區段前後保留的秒數
+
+    Returns:
+        VadResult: 語音區段與總長度
+    """
+    total_seconds = len(audio) / SAMPLE_RATE
+    frame_size = int(FRAME_SECONDS * SAMPLE_RATE)
+    n_frames = len(audio) // frame_size
+    if n_frames == 0:
+        return VadResult([], total_seconds)
+
+    frames = np.asarray(audio[: n_frames * frame_size], np.float32).reshape(
+        n_frames, frame_size
+    )
+    energy_db = 10 * np.log10(np.mean(frames**2, axis=1) + 1e-10)
+    threshold = max(
+        np.percentile(energy_db, 10) + margin_db, energy_db.max() - dynamic_range_db
+    )
+    is_speech = energy_db > threshold
+
+    regions = []
+    start = None
+    for index, speech in enumerate(is_speech):
+        if speech and start is None:
+            start = index
+        elif not speech and start is not None:
+            regions.append([start * FRAME_SECONDS, index * FRAME_SECONDS])
+            start = None
+    if start is not None:
+        regions.append([start * FRAME_SECONDS, n_frames * FRAME_SECONDS])
+
+    merged = []
+    for region in regions:
+        if merged and region[0] - merged[-1][1] < min_silence:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+
+    speech_regions = []
+    for start, end in merged:
+        if end - start < min_speech:
+            continue
+        start = max(start - padding, 0.0)
+        end = min(end + padding, total_seconds)
+        if speech_regions and start <= speech_regions[-1].end:
+            speech_regions[-1].end = end
+        else:
+            speech_regions.append(SpeechRegion(start, end))
+
+    return VadResult(speech_regions, total_seconds)
@@ -0,0 +1,243 @@
+"""
+以小模型草擬、large-v3 驗證的 assisted (speculative) decoding。
+
+草稿模型一次猜出多個 token，large-v3 以一次前向計算驗證整串猜測，接受最長的相符前綴；
+greedy decoding 下輸出與單獨使用 large-v3 相同，但 large-v3 的前向次數變少。
+
+草稿模型必須與主模型使用相同的 tokenizer 與 mel 特徵：openai 的 tiny / small 是 80 個 mel bin、
+詞彙表也少一個 token，不能直接替 large-v3 草擬。預設使用 distil-large-v3 的 decoder
+(WhisperForCausalLM)，它直接沿用 large-v3 的 encoder 輸出，不必重算 encoder。
+
+uv run whisper_assisted.py --files "test-data/*.mp3"
+uv run whisper_assisted.py --assistant openai/whisper-large-v3-turbo --language zh
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+import torch
+from transformers import (
+    AutoModelForSpeechSeq2Seq,
+    AutoProcessor,
+    WhisperForCausalLM,
+)
+
+import audio_cache
+from model_registry import registry
+from whisper_decode import NO_SPACE_LANGS
+
+MAIN_MODEL = "openai/whisper-large-v3"
+DRAFT_MODEL = "distil-whisper/distil-large-v3"
+WINDOW_SAMPLES = 30 * audio_cache.SAMPLE_RATE
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def load_main(model_name: str = MAIN_MODEL, device: str = "cpu"):
+    dtype = torch.float16 if device == "cuda" else torch.float32
+    return registry.get(
+        ("hf-whisper", model_name, device),
+        lambda: AutoModelForSpeechSeq2Seq.from_pretrained(model_name, torch_dtype=dtype)
+        .to(device)
+        .eval(),
+    )
+
+
+def load_assistant(model_name: str = DRAFT_MODEL, device: str = "cpu"):
+    """
+    載入草稿模型。
+
+    distil-whisper 的 checkpoint 只載入 decoder (WhisperForCausalLM)，與主模型共用 encoder 輸出；
+    其他 checkpoint 以完整的 encoder-decoder 載入。
+    """
+    dtype = torch.float16 if device == "cuda" else torch.float32
+    model_class = (
+        WhisperForCausalLM
+        if model_name.startswith("distil-whisper/")
+        else AutoModelForSpeechSeq2Seq
+    )
+    return registry.get(
+        ("hf-whisper-assistant", model_name, device),
+        lambda: model_class.from_pretrained(model_name, torch_dtype=dtype)
+        .to(device)
+        .eval(),
+    )
+
+
+def get_processor(model_name: str = MAIN_MODEL):
+    return registry.get(
+        ("processor", model_name), lambda: AutoProcessor.from_pretrained(model_name)
+    )
+
+
+@contextmanager
+def count_calls(module: torch.nn.Module):
+    """計算 module 在 with 區塊內被前向呼叫的次數"""
+    counter = {"calls": 0}
+
+    def hook(*_):
+        counter["calls"] += 1
+
+    handle = module.register_forward_hook(hook)
+    try:
+        yield counter
+    finally:
+        handle.remove()
+
+
+def decoder_of(model) -> torch.nn.Module:
+    return model.model.decoder
+
+
+def transcribe(
+    audio,
+    model,
+    processor,
+    assistant=None,
+    language: str | None = None,
+) -> tuple[str, dict]:
+    """
+    以 30 秒為單位轉錄音檔，assistant 不為 None 時使用 assisted decoding。
+
+    Returns:
+        tuple: 轉錄文字與統計 (tokens、主模型與草稿模型的 decoder 前向次數、耗時)
+    """
+    audio = audio_cache.load_audio(audio)
+    stats = {"tokens": 0, "main_forwards": 0, "draft_forwards": 0, "elapsed": 0.0}
+    texts = []
+    for offset in range(0, max(len(audio), 1), WINDOW_SAMPLES):
+        inputs = processor(
+            audio[offset : offset + WINDOW_SAMPLES],
+            sampling_rate=audio_cache.SAMPLE_RATE,
+            return_tensors="pt",
+        )
+        input_features = inputs.input_features.to(model.device, model.dtype)
+        options = {"language": language, "task": "transcribe"}
+        if assistant is not None:
+            options["assistant_model"] = assistant
+
+        with count_calls(decoder_of(model)) as main_calls:
+            draft_context = (
+                count_calls(decoder_of(assistant))
+                if assistant is not None
+                else nullcontext({"calls": 0})
+            )
+            with draft_context as draft_calls, torch.no_grad():
+                start = time.perf_counter()
+                generated = model.generate(input_features, **options)
+                stats["elapsed"] += time.perf_counter() - start
+
+        # 文字 token 的 id 都小於 <|endoftext|>，再加上結尾的 <|endoftext|> 本身
+        text_tokens = int((generated < processor.tokenizer.eos_token_id).sum())
+        stats["tokens"] += text_tokens + 1
+        stats["main_forwards"] += main_calls["calls"]
+        stats["draft_forwards"] += draft_calls["calls"]
+        texts.append(processor.batch_decode(generated, skip_special_tokens=True)[0])
+
+    separator = "" if language in NO_SPACE_LANGS else " "
+    return separator.join(text.strip() for text in texts if text.strip()), stats
+
+
+def acceptance_rate(stats: dict) -> float:
+    """
+    估計被接受的草稿 token 比例。
+
+    主模型每次驗證都會產生被接受的草稿 token 加上一個自己的 token，
+    所以被接受的草稿數約為 tokens - main_forwards，每次草稿前向計算猜一個 token。
+    """
+    if not stats["draft_forwards"]:
+        return 0.0
+    accepted = max(stats["tokens"] - stats["main_forwards"], 0)
+    return min(accepted / stats["draft_forwards"], 1.0)
+
+
+def compare(
+    files: list[str],
+    model_name: str = MAIN_MODEL,
+    assistant_name: str = DRAFT_MODEL,
+    device: str = "cpu",
+    language: str | None = None,
+) -> list[dict]:
+    """對每個音檔分別以一般 decoding 與 assisted decoding 轉錄，比較速度與輸出"""
+    processor = get_processor(model_name)
+    model = load_main(model_name, device)
+    assistant = load_assistant(assistant_name, device)
+
+    # warm-up，避免第一個音檔的計時包含初始化成本
+    if files:
+        transcribe(files[0], model, processor, assistant, language)
+
+    rows = []
+    for path in files:
+        plain_text, plain = transcribe(path, model, processor, None, language)
+        assisted_text, assisted = transcribe(
+            path, model, processor, assistant, language
+        )
+        row = {
+            "file": os.path.basename(path),
+            "plain_time": plain["elapsed"],
+            "assisted_time": assisted["elapsed"],
+            "speedup": plain["elapsed"] / assisted["elapsed"]
+            if assisted["elapsed"]
+            else 0.0,
+            "acceptance_rate": acceptance_rate(assisted),
+            "same_output": plain_text == assisted_text,
+            "plain_text": plain_text,
+            "assisted_text": assisted_text,
+            "plain": plain,
+            "assisted": assisted,
+        }
+        rows.append(row)
+        print(
+            f"{row['file']:<22} {row['plain_time']:>7.2f}s "
+            f"{row['assisted_time']:>7.2f}s {row['speedup']:>6.2f}x {row['acceptance_rate']:>7.1%} "
+            f"{'same' if row['same_output'] else 'DIFF'}"
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Assisted decoding for Whisper large-v3 with a small draft model."
+    )
+    parser.add_argument("--files", default="test-data/*.mp3", help="Glob of audio files.")
+    parser.add_argument("--model", default=MAIN_MODEL)
+    parser.add_argument("--assistant", default=DRAFT_MODEL)
+    parser.add_argument("--device", default=default_device())
+    parser.add_argument("--language", help="Force the language instead of detecting it.")
+    parser.add_argument("--output", help="JSON output path.")
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(args.files))
+    print(f"{'File':<22} {'Plain':>8} {'Assisted':>8} {'Speedup':>7} {'Accept':>7}")
+    rows = compare(files, args.model, args.assistant, args.device, args.language)
+    if rows:
+        plain = sum(row["plain_time"] for row in rows)
+        assisted = sum(row["assisted_time"] for row in rows)
+        same = sum(row["same_output"] for row in rows)
+        accepted = sum(
+            max(row["assisted"]["tokens"] - row["assisted"]["main_forwards"], 0)
+            for row in rows
+        )
+        drafted = sum(row["assisted"]["draft_forwards"] for row in rows)
+        print(
+            f"Total: {plain:.1f}s -> {assisted:.1f}s ({plain / assisted:.2f}x), "
+            f"acceptance {accepted / drafted if drafted else 0:.1%}, "
+            f"{same}/{len(rows)} identical outputs"
+        )
+
+    output = args.output or f"dist/assisted-{time.strftime('%Y%m%d-%H%M')}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(rows, file, ensure_ascii=False, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
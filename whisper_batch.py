@@ -0,0 +1,117 @@
+"""
+比較逐一轉錄與 batch 轉錄短音檔的吞吐量 (clips/s)。
+
+每個模型大小跑三種方式：
+- sequential: 逐一呼叫 model.transcribe (asr1.evaluate 原本的方式)
+- batch-1: whisper_decode.transcribe_batch 但 batch_size=1，與 batch 使用相同的解碼設定
+- batch-N: whisper_decode.transcribe_batch 一次處理 N 個音檔
+
+每種方式開始前清空 encoder_cache，音檔先解碼進 audio_cache，只比較模型的部分。
+
+uv run whisper_batch.py --models tiny small --batch-size 16
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import asr1
+import audio_cache
+import whisper_decode
+from encoder_cache import encoder_cache
+from repetition_guard import repetition_guard
+
+
+def run_sequential(model, files: list[str]) -> list[dict]:
+    return [
+        asr1.run_transcription(file, model, vad=False, decode_options={})
+        for file in files
+    ]
+
+
+def run_batched(model, files: list[str], batch_size: int) -> list[dict]:
+    # run_transcription 也在 guard 下解碼，兩邊的條件相同
+    with repetition_guard.active("batch"):
+        results = whisper_decode.transcribe_batch(model, files, batch_size=batch_size)
+    return [
+        {"text": result["transcribe"], "language": result["language"]}
+        for result in results
+    ]
+
+
+def measure(name: str, run, files: list[str]) -> dict:
+    encoder_cache.clear()
+    start = time.perf_counter()
+    results = run()
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": name,
+        "seconds": elapsed,
+        "clips_per_second": len(files) / elapsed,
+        "results": [
+            {"file": file, "language": result["language"], "text": result["text"]}
+            for file, result in zip(files, results)
+        ],
+    }
+
+
+def benchmark(model_size: str, files: list[str], device: str, batch_size: int):
+    model, load_time = asr1.load_model(model_size, device)
+    # 暖機：第一次前向計算包含 kernel 初始化等一次性的成本
+    run_batched(model, files[:1], 1)
+
+    rows = [
+        measure("sequential", lambda: run_sequential(model, files), files),
+        measure("batch-1", lambda: run_batched(model, files, 1), files),
+        measure(
+            f"batch-{batch_size}",
+            lambda: run_batched(model, files, batch_size),
+            files,
+        ),
+    ]
+    baseline = rows[0]["seconds"]
+    for row in rows:
+        row["model"] = model_size
+        row["load_time"] = load_time
+        row["speedup"] = baseline / row["seconds"]
+        print(
+            f"{model_size:<10} {row['mode']:<12} {row['seconds']:>8.1f}s "
+            f"{row['clips_per_second']:>8.2f} {row['speedup']:>7.2f}x"
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare sequential and batched Whisper transcription throughput."
+    )
+    parser.add_argument("--files", default="test-data/*.mp3", help="Glob of audio files.")
+    parser.add_argument(
+        "--models", nargs="+", default=["tiny", "small", "medium", "large-v3"]
+    )
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--output", help="JSON output path.")
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(args.files))
+    for file in files:
+        audio_cache.load_audio(file)
+    print(f"{len(files)} clips")
+    print(f"{'Model':<10} {'Mode':<12} {'Time':>9} {'Clips/s':>8} {'Speedup':>8}")
+
+    rows = []
+    for model_size in args.models:
+        rows += benchmark(model_size, files, args.device, args.batch_size)
+
+    output = args.output or f"dist/whisper-batch-{time.strftime('%Y%m%d-%H%M')}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(rows, file, ensure_ascii=False, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+以 30 秒為單位直接呼叫 Whisper 的 encoder/decoder。
+
+model.transcribe 每次呼叫都會重新解碼音檔、計算 log-mel、跑 encoder 並偵測語言。
+這裡把這些步驟拆開，讓同一份 encoder 輸出可以給多個解碼任務（轉錄、翻譯）共用，
+也讓多個短音檔的視窗可以疊成一個 batch 一起跑 encoder 與 decoder。
+"""
+
+import time
+from collections import defaultdict
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import N_FRAMES, N_SAMPLES
+
+import audio_cache
+from encoder_cache import encoder_cache
+from tracing import tracer
+
+# 不以空白分詞的語言，視窗之間的文字直接相接
+NO_SPACE_LANGS = {"zh", "yue", "ja", "th", "lo", "my"}
+# 一次送進 decoder 的視窗數，避免長音檔一次佔用過多記憶體
+DECODE_BATCH_SIZE = 8
+
+
+def model_dtype(model) -> torch.dtype:
+    return torch.float16 if model.device.type == "cuda" else torch.float32
+
+
+def mel_windows(model, audio: str | np.ndarray) -> torch.Tensor:
+    """將音訊的 log-mel 切成 (視窗數, n_mels, N_FRAMES) 的 30 秒視窗"""
+    audio = audio_cache.load_audio(audio)
+    # 與 model.transcribe 相同，在尾端補 30 秒靜音，最後一個視窗才不會補到非靜音的 0 值
+    mel = encoder_cache.mel(np.asarray(audio), model.dims.n_mels, padding=N_SAMPLES)
+    n_frames = max(mel.shape[-1] - N_FRAMES, 1)
+    return torch.stack(
+        [
+            whisper.pad_or_trim(mel[:, seek : seek + N_FRAMES], N_FRAMES)
+            for seek in range(0, n_frames, N_FRAMES)
+        ]
+    )
+
+
+def encode_windows(
+    model, audio: str | np.ndarray, batch_size: int = DECODE_BATCH_SIZE
+) -> torch.Tensor:
+    """
+    將音訊切成 30 秒視窗，每個視窗只跑一次 encoder。
+
+    log-mel 與 encoder 輸出都經過 encoder_cache，同一段音訊再次編碼時直接取用快取。
+
+    Args:
+        model (Whisper): 已載入的 Whisper 模型
+        audio (str | np.ndarray): 音檔路徑或 16 kHz float32 音訊
+        batch_size (int): 一次送進 encoder 的視窗數
+
+    Returns:
+        torch.Tensor: (視窗數, n_audio_ctx, n_audio_state) 的 encoder 輸出
+    """
+    return encode_mel(model, mel_windows(model, audio), batch_size)
+
+
+def encode_mel(
+    model, windows: torch.Tensor, batch_size: int = DECODE_BATCH_SIZE
+) -> torch.Tensor:
+    with torch.no_grad():
+        return torch.cat(
+            [
+                model.embed_audio(
+                    windows[start : start + batch_size].to(
+                        model.device, model_dtype(model)
+                    )
+                )
+                for start in range(0, len(windows), batch_size)
+            ]
+        )
+
+
+def detect_language(model, audio_features: torch.Tensor) -> str:
+    """以第一個視窗的 encoder 輸出偵測語言"""
+    with tracer.span("whisper.detect_language", "whisper"):
+        _, probs = model.detect_language(audio_features[:1])
+    return max(probs[0], key=probs[0].get)
+
+
+def detect_languages(
+    model, audio_features: torch.Tensor, batch_size: int = DECODE_BATCH_SIZE
+) -> list[str]:
+    """逐一偵測 batch 中每個視窗的語言"""
+    languages = []
+    for start in range(0, len(audio_features), batch_size):
+        with tracer.span("whisper.detect_language", "whisper"):
+            _, probs = model.detect_language(
+                audio_features[start : start + batch_size]
+            )
+        languages.extend(max(prob, key=prob.get) for prob in probs)
+    return languages
+
+
+def decode_windows(
+    model,
+    audio_features: torch.Tensor,
+    task: str,
+    language: str,
+    batch_size: int = DECODE_BATCH_SIZE,
+    **options,
+) -> list[whisper.DecodingResult]:
+    """
+    在已計算好的 encoder 輸出上執行解碼，不再重跑 encoder。
+
+    Args:
+        model (Whisper): 已載入的 Whisper 模型
+        audio_features (torch.Tensor): encode_windows 的輸出
+        task (str): "transcribe" 或 "translate"
+        language (str): 音訊語言
+        batch_size (int): 一次送進 decoder 的視窗數
+        **options: 其他 whisper.DecodingOptions 參數
+
+    Returns:
+        list[DecodingResult]: 每個視窗的解碼結果
+    """
+    decoding_options = whisper.DecodingOptions(
+        task=task,
+        language=language,
+        fp16=model.device.type == "cuda",
+        without_timestamps=True,
+        **options,
+    )
+    results = []
+    for start in range(0, len(audio_features), batch_size):
+        batch = audio_features[start : start + batch_size]
+        with tracer.span("whisper.decode", "whisper", task=task, windows=len(batch)):
+            results.extend(whisper.decode(model, batch, decoding_options))
+    return results
+
+
+def transcribe_batch(
+    model,
+    audio_files: list[str | np.ndarray],
+    tasks: tuple[str, ...] = ("transcribe",),
+    language: str | None = None,
+    batch_size: int = 16,
+    stats: dict | None = None,
+    **options,
+) -> list[dict]:
+    """
+    以 batch 處理多個短音檔。
+
+    每 batch_size 個音檔為一組：所有音檔的 30 秒視窗疊成一個 tensor 一起跑 encoder，
+    每個音檔以自己的第一個視窗偵測語言，再依語言分組、每組以一個 batch 解碼。
+    幾秒長的短音檔只佔一個視窗，batch 讓 encoder 與 decoder 的每次前向計算處理多個音檔。
+
+    與 model.transcribe 不同，這裡不產生時間戳記，也沒有 temperature fallback。
+
+    Args:
+        model (Whisper): 已載入的 Whisper 模型
+        audio_files (list[str | np.ndarray]): 音檔路徑或 16 kHz float32 音訊
+        tasks (tuple[str, ...]): 要執行的解碼任務，"transcribe" 與/或 "translate"
+        language (str | None): 指定所有音檔的語言，None 表示逐一偵測
+        batch_size (int): 每組的音檔數，也是 encoder/decoder 一次處理的視窗數
+        stats (dict | None): 傳入時累加 encode、detect 與各任務的耗時 (秒)
+        **options: 其他 whisper.DecodingOptions 參數
+
+    Returns:
+        list[dict]: 依輸入順序，每個音檔 {"language": ..., <task>: 文字, ...}
+    """
+    stats = {} if stats is None else stats
+    results = []
+    for group_start in range(0, len(audio_files), batch_size):
+        group = audio_files[group_start : group_start + batch_size]
+
+        start = time.perf_counter()
+        windows = [mel_windows(model, audio) for audio in group]
+        # 每個視窗屬於哪個音檔，以及每個音檔第一個視窗的位置
+        owners = [i for i, window in enumerate(windows) for _ in range(len(window))]
+        firsts = [owners.index(i) for i in range(len(group))]
+        audio_features = encode_mel(model, torch.cat(windows), batch_size)
+        stats["encode"] = stats.get("encode", 0) + time.perf_counter() - start
+
+        start = time.perf_counter()
+        if language:
+            languages = [language] * len(group)
+        else:
+            languages = detect_languages(model, audio_features[firsts], batch_size)
+        stats["detect"] = stats.get("detect", 0) + time.perf_counter() - start
+
+        by_language = defaultdict(list)
+        for index, owner in enumerate(owners):
+            by_language[languages[owner]].append(index)
+
+        group_results = [{"language": lang} for lang in languages]
+        for task in tasks:
+            start = time.perf_counter()
+            decoded = [[] for _ in group]
+            for lang, indices in by_language.items():
+                outputs = decode_windows(
+                    model, audio_features[indices], task, lang, batch_size, **options
+                )
+                # indices 由小到大，同一個音檔的視窗維持原本的順序
+                for index, output in zip(indices, outputs):
+                    decoded[owners[index]].append(output)
+            for result, outputs in zip(group_results, decoded):
+                text_language = "en" if task == "translate" else result["language"]
+                result[task] = join_texts(outputs, text_language)
+            stats[task] = stats.get(task, 0) + time.perf_counter() - start
+        results.extend(group_results)
+    return results
+
+
+def join_texts(results: list[whisper.DecodingResult], language: str) -> str:
+    separator = "" if language in NO_SPACE_LANGS else " "
+    return separator.join(result.text for result in results if result.text)
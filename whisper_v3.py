@@ -1,9 +1,20 @@
-from transformers.agents import translation
-import whisper
+import torch
+import argparse
 import time
 import csv
+import threading
 import warnings
 
+import asr1
+import audio_cache
+from asr_cache import asr_cache
+from pipeline_stages import Pipeline, Stage
+from encoder_cache import encoder_cache
+from quantize import QUANTIZE_CHOICES
+from repetition_guard import repetition_guard
+from tracing import tracer
+import vad as voice_activity
+import whisper_decode
 
 # Suppress specific warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="torch.cuda")
@@ -39,25 +50,260 @@ class Record:
         print(f"Transcription Time: {self.transcription_time}")
 
 
-def transcribe_and_translate(audio_file, model):
-    """使用指定的模型轉錄音頻文件並翻譯成英文"""
-    time1 = time.time()
-    # 轉錄原始語音
-    result = model.transcribe(audio_file)
-    time2 = time.time()
-    # # 翻譯成英文
-    translation = model.transcribe(audio_file, task="translate")
-    time3 = time.time()
+def transcribe_and_translate(audio_file, model, single_pass=False, vad=False):
+    """
+    使用指定的模型轉錄音頻文件並翻譯成英文
+
+    預設呼叫兩次 model.transcribe，log-mel 與 encoder 輸出由 encoder_cache 共用，
+    翻譯那次只多跑 decoder；結果包含轉錄的 segments，vad=True 時其時間已換算回原始音訊。
+    single_pass=True 時改以固定 30 秒視窗解碼 (whisper_decode)：沒有 segments、時間戳記、
+    temperature fallback 與 condition_on_previous_text，輸出可能與 model.transcribe 不同。
+    vad=True 時先剔除靜音，只把語音區段送進模型。
+    音檔路徑的結果存在 ASR 結果快取中，音檔與模型都沒變時直接回傳先前的結果。
+    解碼經過 repetition_guard，陷入重複迴圈的片段會提早結束。
+    """
+    return asr_cache.get_or_run(
+        audio_file,
+        "whisper",
+        getattr(model, "checkpoint", None),
+        lambda: run_transcribe_and_translate(audio_file, model, single_pass, vad),
+        task="transcribe+translate",
+        options=cache_options(single_pass, vad),
+    )
+
+
+def cache_options(single_pass: bool, vad: bool) -> dict:
+    return {
+        "single_pass": single_pass,
+        "vad": vad,
+        "repetition_guard": repetition_guard.cache_options(),
+    }
+
+
+def run_transcribe_and_translate(audio_file, model, single_pass, vad):
+    audio = audio_cache.load_audio(audio_file)
+    if vad:
+        speech = voice_activity.detect_speech(audio)
+        audio = speech.compact(audio)
+        if not speech.regions:
+            print(speech.report(0))
+            return {
+                "language": "",
+                "translation": "",
+                "translation_time": 0,
+                "transcription": "",
+                "transcription_time": 0,
+                "segments": [],
+            }
+
+    label = audio_file if isinstance(audio_file, str) else ""
+    with repetition_guard.active(label):
+        if single_pass:
+            result = transcribe_and_translate_single_pass(audio, model)
+        else:
+            result = transcribe_and_translate_twice(audio, model)
+    if vad:
+        print(
+            speech.report(result["transcription_time"] + result["translation_time"])
+        )
+        # segments 的時間是在剔除靜音後的音訊上量到的，換算回原始音訊的時間
+        if "segments" in result:
+            result["segments"] = speech.restore_timestamps(result["segments"])
+    return result
+
+
+def transcribe_and_translate_twice(audio, model):
+    """分別呼叫 model.transcribe 做轉錄與翻譯"""
+    with encoder_cache.cached_mel():
+        time1 = time.time()
+        # 轉錄原始語音
+        with tracer.span("whisper.transcribe", "whisper"):
+            result = model.transcribe(audio)
+        time2 = time.time()
+        # # 翻譯成英文
+        with tracer.span("whisper.transcribe", "whisper", task="translate"):
+            translation = model.transcribe(audio, task="translate")
+        time3 = time.time()
 
     return {
         "language": result["language"],
         "translation": translation["text"],
-        "translation_time": time2 - time1,
+        "translation_time": time3 - time2,
         "transcription": result["text"],
-        "transcription_time": time3 - time2,
+        "transcription_time": time2 - time1,
+        "segments": result["segments"],
+    }
+
+
+def transcribe_and_translate_single_pass(audio_file, model):
+    """共用一次 encoder 運算的轉錄 + 翻譯，回傳格式與 transcribe_and_translate 相同"""
+    time1 = time.time()
+    audio_features = whisper_decode.encode_windows(model, audio_file)
+    language = whisper_decode.detect_language(model, audio_features)
+    transcription = whisper_decode.decode_windows(
+        model, audio_features, task="transcribe", language=language
+    )
+    time2 = time.time()
+    translation = whisper_decode.decode_windows(
+        model, audio_features, task="translate", language=language
+    )
+    time3 = time.time()
+
+    return {
+        "language": language,
+        "translation": whisper_decode.join_texts(translation, "en"),
+        "translation_time": time3 - time2,
+        "transcription": whisper_decode.join_texts(transcription, language),
+        "transcription_time": time2 - time1,
     }
 
 
+def pipelined_transcribe_and_translate(audio_files, model, vad=False) -> list[dict]:
+    """
+    以 load → encode → transcribe → translate 管線處理多個音檔，以 30 秒視窗解碼，
+    結果與 transcribe_and_translate(single_pass=True) 相同，並共用同一份 ASR 結果快取。
+
+    Whisper 的 decoder 以 forward hook 保存 KV cache，同一個模型不能同時執行兩個解碼，
+    所以 transcribe 與 translate 階段共用一把鎖；encoder 不受影響，下一個檔案的
+    音檔解碼與 encoder 可以和目前檔案的解碼重疊。
+    """
+    decoder_lock = threading.Lock()
+    checkpoint = getattr(model, "checkpoint", None)
+    options = cache_options(single_pass=True, vad=vad)
+
+    def load(audio_file):
+        key = asr_cache.key(
+            audio_file, "whisper", checkpoint, "transcribe+translate", options=options
+        )
+        job = {"file": audio_file, "key": key, "result": asr_cache.lookup(key)}
+        if job["result"] is None:
+            audio = audio_cache.load_audio(audio_file)
+            if vad:
+                speech = voice_activity.detect_speech(audio)
+                audio = speech.compact(audio)
+                if not speech.regions:
+                    print(speech.report(0))
+                    job["result"] = {
+                        "language": "",
+                        "translation": "",
+                        "translation_time": 0,
+                        "transcription": "",
+                        "transcription_time": 0,
+                    }
+            job["audio"] = audio
+        return job
+
+    def encode(job):
+        if job["result"] is None:
+            start = time.time()
+            job["features"] = whisper_decode.encode_windows(model, job.pop("audio"))
+            job["encode_time"] = time.time() - start
+        return job
+
+    def transcribe(job):
+        if job["result"] is None:
+            with decoder_lock, repetition_guard.active(job["file"]):
+                start = time.time()
+                language = whisper_decode.detect_language(model, job["features"])
+                transcription = whisper_decode.decode_windows(
+                    model, job["features"], task="transcribe", language=language
+                )
+                elapsed = time.time() - start
+            job["language"] = language
+            job["transcription"] = whisper_decode.join_texts(transcription, language)
+            job["transcription_time"] = job["encode_time"] + elapsed
+        return job
+
+    def translate(job):
+        if job["result"] is None:
+            with decoder_lock, repetition_guard.active(job["file"]):
+                start = time.time()
+                translation = whisper_decode.decode_windows(
+                    model,
+                    job.pop("features"),
+                    task="translate",
+                    language=job["language"],
+                )
+                elapsed = time.time() - start
+            job["result"] = {
+                "language": job["language"],
+                "translation": whisper_decode.join_texts(translation, "en"),
+                "translation_time": elapsed,
+                "transcription": job["transcription"],
+                "transcription_time": job["transcription_time"],
+            }
+            asr_cache.store(job["key"], job["result"])
+        return job["result"]
+
+    pipeline = Pipeline(
+        [
+            Stage("load", load),
+            Stage("encode", encode),
+            Stage("transcribe", transcribe),
+            Stage("translate", translate),
+        ]
+    )
+    results = pipeline.run(audio_files)
+    pipeline.print_report()
+    return results
+
+
+def batched_transcribe_and_translate(audio_files, model, batch_size=16) -> list[dict]:
+    """
+    以 batch 轉錄並翻譯多個短音檔，回傳格式與 transcribe_and_translate 相同；
+    與 single_pass=True 一樣以 30 秒視窗解碼，沒有時間戳記。
+
+    所有音檔的視窗一起跑 encoder，逐一偵測語言後依語言分組解碼
+    (whisper_decode.transcribe_batch)；耗時為整個 batch 平均到每個音檔。
+    已在 ASR 結果快取中的音檔不會重跑；無法讀取的音檔回傳 None，不影響其他音檔。
+    """
+    checkpoint = getattr(model, "checkpoint", None)
+    options = {**cache_options(single_pass=True, vad=False), "batched": True}
+    keys = [None] * len(audio_files)
+    results = [None] * len(audio_files)
+    audios = {}
+    for i, audio_file in enumerate(audio_files):
+        # 快取鍵會讀取檔案計算 hash，不存在的檔案在這裡就會失敗
+        try:
+            keys[i] = asr_cache.key(
+                audio_file,
+                "whisper",
+                checkpoint,
+                "transcribe+translate",
+                options=options,
+            )
+            results[i] = asr_cache.lookup(keys[i])
+            if results[i] is None:
+                audios[i] = audio_cache.load_audio(audio_file)
+        except Exception as e:
+            print(f"Error processing {audio_file}: {str(e)}\n")
+    if not audios:
+        return results
+
+    stats = {}
+    with repetition_guard.active("batch"):
+        decoded = whisper_decode.transcribe_batch(
+            model,
+            list(audios.values()),
+            tasks=("transcribe", "translate"),
+            batch_size=batch_size,
+            stats=stats,
+        )
+    transcription_time = stats["encode"] + stats["detect"] + stats["transcribe"]
+    transcription_time /= len(audios)
+    translation_time = stats["translate"] / len(audios)
+    for i, result in zip(audios, decoded):
+        results[i] = {
+            "language": result["language"],
+            "translation": result["translate"],
+            "translation_time": translation_time,
+            "transcription": result["transcribe"],
+            "transcription_time": transcription_time,
+        }
+        asr_cache.store(keys[i], results[i])
+    return results
+
+
 def write_records_to_csv(records, filename):
     """將記錄寫入CSV文件"""
     with open(filename, mode="w", newline="", encoding="utf-8") as file:
@@ -88,16 +334,36 @@ def write_records_to_csv(records, filename):
 
 
 def transscribe_all(
-    filename: str, langs=["en", "zh", "ja", "ko", "th"], model_size="tiny"
+    filename: str,
+    langs=["en", "zh", "ja", "ko", "th"],
+    model_size="tiny",
+    vad=False,
+    quantize=None,
+    pipelined=False,
+    batched=False,
+    single_pass=False,
 ):
     test_data_dir = "test-data"
-    model = whisper.load_model(model_size)
+    device = "cuda" if quantize is None and torch.cuda.is_available() else "cpu"
+    model, _ = asr1.load_model(model_size, device, quantize=quantize)
     records = []
 
     audio_files = [f"{test_data_dir}/{filename}-{lang}.mp3" for lang in langs]
+    if batched and vad:
+        raise ValueError("batched transcription does not support vad")
+    if batched:
+        results = batched_transcribe_and_translate(audio_files, model)
+    elif pipelined:
+        results = pipelined_transcribe_and_translate(audio_files, model, vad=vad)
+    else:
+        results = (
+            transcribe_and_translate(audio_file, model, single_pass, vad)
+            for audio_file in audio_files
+        )
 
-    for audio_file in audio_files:
-        result = transcribe_and_translate(audio_file, model)
+    for audio_file, result in zip(audio_files, results):
+        if result is None:
+            continue
         record = Record(
             model=model_size,
             filename=audio_file,
@@ -114,20 +380,87 @@ def transscribe_all(
     return records
 
 
-def test_results(filename, model_sizes=["small", "medium", "large-v3"]):
+def test_results(
+    filename,
+    model_sizes=["small", "medium", "large-v3"],
+    quantize=None,
+    pipelined=False,
+    batched=False,
+    single_pass=False,
+):
     records = []
     langs = ["en", "zh", "ja", "ko", "th"]
 
     for model_size in model_sizes:
-        records += transscribe_all(filename, langs=langs, model_size=model_size)
+        with tracer.context(f"whisper-{model_size}"):
+            records += transscribe_all(
+                filename,
+                langs=langs,
+                model_size=model_size,
+                quantize=quantize,
+                pipelined=pipelined,
+                batched=batched,
+                single_pass=single_pass,
+            )
 
     return records
 
 
 def main():
-    records = test_results("serenity", model_sizes=["large-v3"])
-    records += test_results("spiderman", model_sizes=["large-v3"])
-    records += test_results("thinking", model_sizes=["large-v3"])
+    parser = argparse.ArgumentParser(description="Transcribe and translate test clips.")
+    parser.add_argument("--quantize", choices=QUANTIZE_CHOICES)
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached results and re-run every file.",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Overlap audio loading, encoding and decoding across files.",
+    )
+    parser.add_argument(
+        "--batched",
+        action="store_true",
+        help="Encode and decode all clips of a model as one batch.",
+    )
+    parser.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="Decode fixed 30 s windows without timestamps or temperature fallback.",
+    )
+    parser.add_argument(
+        "--no-repetition-guard",
+        action="store_true",
+        help="Let the decoder run repetition loops to the token limit.",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write a Chrome trace of every stage to PATH and print a summary.",
+    )
+    args = parser.parse_args()
+    asr_cache.refresh = args.refresh
+    repetition_guard.config.enabled = not args.no_repetition_guard
+    if args.trace:
+        tracer.enable()
+
+    records = []
+    for filename in ["serenity", "spiderman", "thinking"]:
+        records += test_results(
+            filename,
+            model_sizes=["large-v3"],
+            quantize=args.quantize,
+            pipelined=args.pipelined,
+            batched=args.batched,
+            single_pass=args.single_pass,
+        )
+    encoder_cache.print_stats()
+    asr_cache.print_stats()
+    repetition_guard.print_report()
+    if args.trace:
+        tracer.print_summary()
+        tracer.export(args.trace)
     filename = f"dist/whisper-{time.strftime('%Y%m%d-%H%M')}.csv"
     write_records_to_csv(records, filename)
 